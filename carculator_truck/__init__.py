@@ -15,18 +15,36 @@ __all__ = (
     "TruckModel",
     "InventoryTruck",
     "get_driving_cycle",
+    "get_driving_cycle_and_gradient",
 )
 
 # library version
 __version__ = (0, 5, 0, "dev0")
 
+from importlib import import_module
 from pathlib import Path
 
 DATA_DIR = Path(__file__).resolve().parent / "data"
 
-from carculator_utils.array import fill_xarray_from_input_parameters
+# public objects are imported on first access (PEP 562), so that importing
+# the package does not import xarray, the inventory or the truck model
+LAZY_IMPORTS = {
+    "fill_xarray_from_input_parameters": "carculator_utils.array",
+    "get_driving_cycle": "carculator_truck.driving_cycles",
+    "get_driving_cycle_and_gradient": "carculator_truck.driving_cycles",
+    "InventoryTruck": "carculator_truck.inventory",
+    "TruckModel": "carculator_truck.model",
+    "TruckInputParameters": "carculator_truck.truck_input_parameters",
+}
 
-from .driving_cycles import get_driving_cycle
-from .inventory import InventoryTruck
-from .model import TruckModel
-from .truck_input_parameters import TruckInputParameters
+
+def __getattr__(name):
+    if name in LAZY_IMPORTS:
+        value = getattr(import_module(LAZY_IMPORTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,158 @@
+"""
+array_view.py contains ArrayIndex and ArrayView, which give NumPy access to the
+array of a vehicle model by label, without going through xarray indexing.
+"""
+
+from functools import lru_cache
+
+import numexpr as ne
+import numpy as np
+import xarray as xr
+
+# dimensions that can be selected by label, in the order of the keys of ArrayView
+LABELLED_DIMS = ("parameter", "powertrain", "size")
+
+# expressions are evaluated with numexpr on arrays of at least this many values,
+# if numexpr can use several threads; below that, NumPy is faster
+NUMEXPR_MIN_SIZE = 2**17
+# functions of numexpr expressions, when evaluated with NumPy
+NUMPY_FUNCTIONS = {"__builtins__": {}, "where": np.where, "exp": np.exp, "log": np.log}
+
+
+@lru_cache(maxsize=None)
+def compile_expression(expression: str):
+    """
+    Compile an expression, to be evaluated with NumPy, once per process.
+
+    :param expression: numexpr expression
+    :return: code object
+    """
+    return compile(expression, "<expression>", "eval")
+
+
+class ArrayIndex:
+    """
+    Position of each label of the `parameter`, `powertrain` and `size`
+    dimensions of an array, and the axis of each dimension.
+
+    :ivar array: array the index was built for
+    :vartype array: xarray.DataArray
+    :ivar positions: position of each label, for each dimension
+    :vartype positions: dict
+    :ivar axes: axis of each dimension
+    :vartype axes: dict
+    """
+
+    def __init__(self, array: xr.DataArray) -> None:
+        """
+        :param array: array of the vehicle model
+        """
+
+        self.array = array
+        self.axes = {dim: array.dims.index(dim) for dim in LABELLED_DIMS}
+        self.positions = {
+            dim: {label: i for i, label in enumerate(array.coords[dim].values.tolist())}
+            for dim in LABELLED_DIMS
+        }
+
+    def locate(self, key) -> tuple:
+        """
+        Return the NumPy index of `key` in the array.
+
+        :param key: parameter name or list of parameter names, optionally
+            followed by a powertrain and a size (None selects all labels)
+        :return: tuple of indices, one per dimension of the array
+        """
+
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        index = [slice(None)] * self.array.ndim
+        for dim, labels in zip(LABELLED_DIMS, key):
+            if labels is None:
+                continue
+            positions = self.positions[dim]
+            index[self.axes[dim]] = (
+                [positions[label] for label in labels]
+                if isinstance(labels, list)
+                else positions[labels]
+            )
+
+        return tuple(index)
+
+
+class ArrayView:
+    """
+    NumPy access to the array of a vehicle model, by label.
+
+    ``view["curb mass"]`` returns the values of a parameter, as a NumPy view of
+    shape (size, powertrain, year, value). A powertrain and a size can follow
+    the parameter name (e.g., ``view["fuel mass", "ICEV-g"]``), in which case
+    the corresponding dimensions are dropped. A list of parameter names returns
+    a copy, with the `parameter` dimension kept. Values are assigned in place,
+    with NumPy broadcasting rules, or evaluated with numexpr directly into the
+    array with :meth:`evaluate`.
+
+    :ivar index: index of the array
+    :vartype index: ArrayIndex
+    """
+
+    def __init__(self, index: ArrayIndex) -> None:
+        """
+        :param index: index of the array of the vehicle model
+        """
+        self.index = index
+        self.values = index.array.values
+
+    def __getitem__(self, key) -> np.ndarray:
+        return self.values[self.index.locate(key)]
+
+    def __setitem__(self, key, value) -> None:
+        self.values[self.index.locate(key)] = value
+
+    def evaluate(self, target, expression: str, **variables) -> np.ndarray:
+        """
+        Evaluate an expression and write the result in place.
+
+        Large arrays are evaluated with numexpr, in a single multi-threaded pass
+        over the variables of the expression. Small arrays, or arrays evaluated
+        with a single thread, are evaluated with NumPy. numexpr calculates
+        constants in double precision, so both can differ in the last digit of
+        single-precision values.
+
+        For example::
+
+            view.evaluate(
+                "toll cost",
+                "toll / (cargo / 1000)",
+                toll="toll cost per km",
+                cargo="cargo mass",
+            )
+
+        :param target: parameter the result is written to, optionally followed
+            by a powertrain and a size
+        :param expression: numexpr expression, which can use `where`, `exp` and `log`
+        :param variables: value of each variable of the expression: a key of the
+            view (parameter name, optionally followed by a powertrain and a size),
+            an array or a number
+        :return: values of `target`
+        """
+
+        local_dict = {
+            name: self[value] if isinstance(value, (str, tuple)) else value
+            for name, value in variables.items()
+        }
+        out = self[target]
+
+        if out.size >= NUMEXPR_MIN_SIZE and ne.get_num_threads() > 1:
+            return ne.evaluate(
+                expression,
+                local_dict=local_dict,
+                global_dict={},
+                out=out,
+                casting="same_kind",
+            )
+
+        out[...] = eval(compile_expression(expression), NUMPY_FUNCTIONS, local_dict)
+
+        return out
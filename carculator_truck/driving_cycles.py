@@ -1,32 +1,68 @@
+from functools import lru_cache
+
 import numpy as np
 from carculator_utils import get_standard_driving_cycle_and_gradient
 
 
+@lru_cache(maxsize=None)
+def load_driving_cycle_and_gradient(size: tuple, name: str) -> tuple:
+    """
+    Load the driving cycle and road gradient data, once per process
+    for a given tuple of sizes and driving cycle name.
+    The arrays returned are shared by all callers, and are read-only.
+
+    :param size: Tuple of vehicle sizes.
+    :param name: The name of the driving cycle.
+    :return: tuple of :meth:`ndarray` objects (driving cycle, road gradient)
+    """
+
+    cycle, gradient = get_standard_driving_cycle_and_gradient(
+        vehicle_type="truck",
+        vehicle_sizes=list(size),
+        name=name,
+    )
+
+    for arr in (cycle, gradient):
+        arr.flags.writeable = False
+
+    return cycle, gradient
+
+
+def get_driving_cycle_and_gradient(size: list, name: str) -> tuple:
+    """
+    Get driving cycle and road gradient data.
+    The arrays returned are read-only: copy them before modifying them.
+
+    :param size: List of vehicle sizes.
+    :param name: The name of the driving cycle.
+    :return: tuple of :meth:`ndarray` objects (driving cycle, road gradient)
+    """
+
+    if isinstance(size, str):
+        size = [size]
+
+    return load_driving_cycle_and_gradient(tuple(size), name)
+
+
 def get_driving_cycle(size: list, name: str) -> np.ndarray:
     """
     Get driving cycle.
+    The array returned is read-only: copy it before modifying it.
 
     :param size: List of vehicle sizes.
     :param name: The name of the driving cycle.
     :return: :meth:`ndarray` object
     """
-    return get_standard_driving_cycle_and_gradient(
-        vehicle_type="truck",
-        vehicle_sizes=size,
-        name=name,
-    )[0]
+    return get_driving_cycle_and_gradient(size, name)[0]
 
 
 def get_road_gradient(size: list, name: str) -> np.ndarray:
     """
     Get road gradient data.
+    The array returned is read-only: copy it before modifying it.
 
     :param size: List of vehicle sizes.
     :param name: The name of the driving cycle.
     :return: :meth:`ndarray` object
     """
-    return get_standard_driving_cycle_and_gradient(
-        vehicle_type="truck",
-        vehicle_sizes=size,
-        name=name,
-    )[1]
+    return get_driving_cycle_and_gradient(size, name)[1]
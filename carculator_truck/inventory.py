@@ -2,17 +2,456 @@
 inventory.py contains Inventory which provides all methods to solve inventories.
 """
 
+import copy
+import hashlib
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
 
 import numpy as np
-from carculator_utils.inventory import Inventory
+import xarray as xr
+from carculator_utils import inventory as utils_inventory
+from carculator_utils.inventory import DATA_DIR as UTILS_DATA_DIR
+from carculator_utils.inventory import Inventory, format_array
+from scipy import sparse
+from scipy.sparse.linalg import splu, spsolve
 
 from . import DATA_DIR
+from .profiling import stage
+from .sparse_matrix import SparseAMatrix
 
 warnings.filterwarnings("ignore", category=np.VisibleDeprecationWarning)
 
 IAM_FILES_DIR = DATA_DIR / "IAM"
 
+# Components of the vehicles, as inputs of the truck activities.
+# The amount of each input is the sum of `parameters`, multiplied by
+# the parameters in `scaling` (if any), divided by the parameters in `divisor`
+# (if any) and multiplied by `factor`. The input can be restricted to
+# vehicles with (True) or without (False) a combustion engine (`combustion`),
+# to vehicles with a gross mass, in kg, within [lower, upper[ (`gross mass`),
+# or to some powertrains (`powertrains`).
+# Inputs are looked up by `activity`, `excludes` and `excludes_in`
+# (see :meth:`InventoryTruck.find_input_indices`).
+VEHICLE_COMPONENTS = [
+    {
+        "activity": ("assembly operation, for lorry",),
+        "parameters": ["curb mass"],
+        "factor": -1,
+    },
+    {
+        "activity": ("frame, blanks and saddle, for lorry",),
+        "parameters": ["glider base mass"],
+        "factor": -1,
+    },
+    {
+        "activity": ("suspension, for lorry",),
+        "parameters": ["suspension mass", "braking system mass"],
+        "factor": -1,
+    },
+    {
+        "activity": ("tires and wheels, for lorry",),
+        "parameters": ["wheels and tires mass"],
+        "factor": -1,
+    },
+    {
+        "activity": ("exhaust system, for lorry",),
+        "parameters": ["exhaust system mass"],
+        "factor": -1,
+    },
+    {
+        "activity": ("power electronics, for lorry",),
+        "parameters": ["electrical system mass"],
+        "factor": -1,
+    },
+    # Transmission (52% transmission shaft, 36% gearbox + 12% retarder)
+    {
+        "activity": ("transmission, for lorry",),
+        "parameters": ["transmission mass"],
+        "factor": -0.52,
+    },
+    {
+        "activity": ("gearbox, for lorry",),
+        "parameters": ["transmission mass"],
+        "factor": -0.36,
+    },
+    {
+        "activity": ("retarder, for lorry",),
+        "parameters": ["transmission mass"],
+        "factor": -0.12,
+    },
+    {
+        "activity": ("other components, for hybrid electric lorry",),
+        "parameters": ["other components mass"],
+        "factor": -1,
+        "combustion": True,
+    },
+    {
+        "activity": ("other components, for electric lorry",),
+        "parameters": ["other components mass"],
+        "factor": -1,
+        "combustion": False,
+    },
+    {
+        "activity": ("glider lightweighting",),
+        "parameters": ["glider base mass"],
+        "scaling": ["lightweighting"],
+        "factor": -1,
+    },
+    # Maintenance, per ton of gross mass
+    {
+        "activity": ("maintenance, lorry 16 metric ton",),
+        "excludes": ("CH",),
+        "excludes_in": 1,
+        "parameters": ["gross mass"],
+        "factor": -1 / 1000 / 16,
+        "gross mass": (0, 26000),
+    },
+    {
+        "activity": ("maintenance, lorry 28 metric ton",),
+        "parameters": ["gross mass"],
+        "factor": -1 / 1000 / 28,
+        "gross mass": (26000, 40000),
+    },
+    {
+        "activity": ("maintenance, lorry 40 metric ton",),
+        "parameters": ["gross mass"],
+        "factor": -1 / 1000 / 40,
+        "gross mass": (40000, np.inf),
+    },
+    # Electric powertrain components
+    {
+        "activity": ("market for converter, for electric passenger car",),
+        "parameters": ["converter mass"],
+        "factor": -1,
+    },
+    {
+        "activity": ("market for electric motor, electric passenger car",),
+        "parameters": ["electric engine mass"],
+        "factor": -1,
+    },
+    {
+        "activity": ("market for inverter, for electric passenger car",),
+        "parameters": ["inverter mass"],
+        "factor": -1,
+    },
+    {
+        "activity": ("market for power distribution unit, for electric passenger car",),
+        "parameters": ["power distribution unit mass"],
+        "factor": -1,
+    },
+    {
+        "activity": ("internal combustion engine, for lorry",),
+        "parameters": ["combustion engine mass"],
+        "factor": -1,
+    },
+    # Use the inventory of Wolff et al. 2020 for lead acid battery
+    # for non-electric and non-hybrid trucks: 16 kg/battery, replaced every 5 years
+    {
+        "activity": ("lead acid battery, for lorry",),
+        "parameters": ["lifetime kilometers"],
+        "divisor": ["kilometers per year"],
+        "factor": -16.0 / 5,
+        "combustion": True,
+    },
+    {
+        "activity": ("fuel tank, for diesel vehicle",),
+        "parameters": ["fuel tank mass"],
+        "factor": -1,
+        "powertrains": ["ICEV-d", "HEV-d", "PHEV-d"],
+    },
+    # End-of-life disposal and treatment, per ton of gross mass
+    {
+        "activity": ("treatment of used lorry, 16 metric ton",),
+        "parameters": ["gross mass"],
+        "factor": 1 / 1000 / 16,
+        "gross mass": (0, 26000),
+    },
+    {
+        "activity": ("treatment of used lorry, 28 metric ton",),
+        "parameters": ["gross mass"],
+        "factor": -1 / 1000 / 28,
+        "gross mass": (26000, 40000),
+    },
+    {
+        "activity": ("treatment of used lorry, 40 metric ton",),
+        "parameters": ["gross mass"],
+        "factor": -1 / 1000 / 40,
+        "gross mass": (40000, np.inf),
+    },
+]
+
+# Fuels burnt by combustion vehicles: powertrains using the fuel,
+# and suffix of the powertrains in the names of the transport activities
+COMBUSTION_FUELS = {
+    "methane": (["ICEV-g"], "EV-g"),
+    "diesel": (["ICEV-d", "PHEV-d", "HEV-d"], "EV-d"),
+}
+
+# Fuel of the powertrains whose lower heating value depends on the fuel blend,
+# as in `VehicleModel.set_average_lhv()`
+LHV_POWERTRAINS = {
+    "ICEV-p": "petrol",
+    "ICEV-d": "diesel",
+    "HEV-d": "diesel",
+    "HEV-p": "petrol",
+    "PHEV-c-d": "diesel",
+    "PHEV-c-p": "petrol",
+    "ICEV-g": "methane",
+    "FCEV": "hydrogen",
+}
+
+
+# LU factorisations of the background block of the A matrix, by content of the block.
+# The background block only depends on the ecoinvent version and on the fuels used,
+# so that inventories built for other countries, methods or indicators reuse them.
+BACKGROUND_FACTORISATIONS = {}
+MAX_BACKGROUND_FACTORISATIONS = 16
+
+
+def factorise_background(matrix: sparse.csr_matrix):
+    """
+    Return the LU factorisation of the background block of the A matrix,
+    computed once for each distinct block and kept in `BACKGROUND_FACTORISATIONS`.
+
+    :param matrix: background block of the A matrix, for one iteration and one year
+    :return: :class:`scipy.sparse.linalg.SuperLU` object
+    """
+
+    matrix = sparse.csc_matrix(matrix)
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+
+    key = hashlib.sha1()
+    for array in [matrix.indptr, matrix.indices, matrix.data]:
+        key.update(np.ascontiguousarray(array).tobytes())
+    key = (matrix.shape, key.hexdigest())
+
+    if key not in BACKGROUND_FACTORISATIONS:
+        if len(BACKGROUND_FACTORISATIONS) >= MAX_BACKGROUND_FACTORISATIONS:
+            del BACKGROUND_FACTORISATIONS[next(iter(BACKGROUND_FACTORISATIONS))]
+        BACKGROUND_FACTORISATIONS[key] = splu(matrix)
+
+    return BACKGROUND_FACTORISATIONS[key]
+
+
+class TechnosphereFactorisation:
+    """
+    Factorisation of the A matrix of one iteration and one year: the LU factorisation
+    of the background block, and the Schur complement of the foreground activities.
+
+    :ivar matrix: A matrix
+    :vartype matrix: scipy.sparse.csr_matrix
+    :ivar lu: LU factorisation of the background block, or of the whole matrix,
+        if the background block is singular
+    :vartype lu: scipy.sparse.linalg.SuperLU
+    """
+
+    def __init__(self, matrix: sparse.csr_matrix, background_size: int) -> None:
+        """
+        :param matrix: A matrix, for one iteration and one year
+        :param background_size: number of background activities, which come first
+        """
+
+        self.matrix = matrix
+        self.n = background_size
+
+        try:
+            self.lu = factorise_background(matrix[: self.n, : self.n])
+        except RuntimeError:
+            # singular background block: the whole matrix is solved at once
+            self.lu, self.n = splu(sparse.csc_matrix(matrix)), None
+            return
+
+        self.background_solution = self.lu.solve(matrix[: self.n, self.n :].toarray())
+        self.foreground_to_background = matrix[self.n :, : self.n]
+        self.schur_complement = (
+            matrix[self.n :, self.n :].toarray()
+            - self.foreground_to_background @ self.background_solution
+        )
+
+    def solve(self, demand: np.ndarray) -> np.ndarray:
+        """
+        Solve the A matrix for `demand`.
+
+        :param demand: final demand, as a vector or as one column per demand
+        :return: supply, of the same shape as `demand`
+        """
+
+        demand = np.asarray(demand, dtype=float)
+        if self.n is None:
+            return self.lu.solve(demand)
+
+        supply = self.lu.solve(demand[: self.n])
+        foreground = np.linalg.solve(
+            self.schur_complement,
+            demand[self.n :] - self.foreground_to_background @ supply,
+        )
+
+        return np.concatenate(
+            [supply - self.background_solution @ foreground, foreground]
+        )
+
+
+class FactorisedMatrix:
+    """
+    Stand-in for the A matrix of an inventory, while
+    :meth:`carculator_utils.inventory.Inventory.calculate_impacts` runs
+    (see :func:`factorised_technosphere`): the matrix of the first iteration
+    and of a year, as selected by the base method to be solved, is returned as
+    its :class:`TechnosphereFactorisation`, computed once per year. Other
+    selections are read from the A matrix.
+    """
+
+    def __init__(self, A, background_size: int) -> None:
+        """
+        :param A: A matrix of the inventory, dense or as a :class:`SparseAMatrix`
+        :param background_size: number of background activities, which come first
+        """
+
+        self.A = A
+        self.background_size = background_size
+        self.factorisations = {}
+
+    def __getitem__(self, key):
+        if (
+            isinstance(key, tuple)
+            and len(key) == 3
+            and isinstance(key[0], (int, np.integer))
+            and key[0] == 0
+            and key[1] is Ellipsis
+            and isinstance(key[2], (int, np.integer))
+        ):
+            year = int(key[2])
+            if year not in self.factorisations:
+                self.factorisations[year] = TechnosphereFactorisation(
+                    sparse.csr_matrix(self.A[key]), self.background_size
+                )
+            return self.factorisations[year]
+
+        return self.A[key]
+
+    def __getattr__(self, name):
+        # not called for the attributes set in `__init__`, unless they are missing
+        if "A" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.A, name)
+
+
+class FactorisedSparse:
+    """
+    Stand-in for :mod:`scipy.sparse` in :mod:`carculator_utils.inventory`
+    (see :func:`factorised_technosphere`), which solves factorised matrices
+    with their factorisation, and other matrices with SciPy.
+    """
+
+    def __init__(self) -> None:
+        self.linalg = self
+
+    @staticmethod
+    def csr_matrix(matrix, *args, **kwargs):
+        if isinstance(matrix, TechnosphereFactorisation):
+            return matrix
+        return sparse.csr_matrix(matrix, *args, **kwargs)
+
+    @staticmethod
+    def spsolve(matrix, demand, *args, **kwargs):
+        if isinstance(matrix, TechnosphereFactorisation):
+            return matrix.solve(demand)
+        return spsolve(matrix, demand, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(sparse, name)
+
+
+@contextmanager
+def factorised_technosphere(inventory: "InventoryTruck"):
+    """
+    Within the block, :meth:`carculator_utils.inventory.Inventory.calculate_impacts`
+    solves the A matrix of each year with a factorisation computed once per year,
+    instead of solving the whole matrix once for each input.
+
+    :param inventory: inventory whose impacts are calculated
+    """
+
+    A, module_sparse = inventory.A, utils_inventory.sparse
+    inventory.A = FactorisedMatrix(A, inventory.background_size)
+    utils_inventory.sparse = FactorisedSparse()
+    try:
+        yield
+    finally:
+        inventory.A, utils_inventory.sparse = A, module_sparse
+
+
+class InputIndex:
+    """
+    Index of the inputs of the A matrix, built once per inventory, which maps
+    queries on input names (prefix, substrings to contain or to exclude) to
+    row or column indices. Inputs are scanned once per distinct query,
+    and the indices found are kept for subsequent queries.
+
+    :ivar inputs: list of (input, index) tuples
+    :vartype inputs: list
+    """
+
+    def __init__(self, inputs: dict) -> None:
+        self.inputs = list(inputs.items())
+        self.queries = {}
+
+    def find(
+        self,
+        contains: tuple = (),
+        excludes: tuple = (),
+        excludes_in: int = 0,
+        prefix: str = "",
+    ) -> list:
+        """
+        Return the indices of the inputs whose name starts with `prefix`
+        and contains all strings in `contains`, and whose item at position
+        `excludes_in` contains none of the strings in `excludes`.
+
+        :param contains: strings the name of the input must contain
+        :param excludes: strings the item `excludes_in` of the input must not contain
+        :param excludes_in: position of the item of the input to apply `excludes` to
+        :param prefix: string the name of the input must start with
+        :return: list of indices
+        """
+
+        query = (tuple(contains), tuple(excludes), excludes_in, prefix)
+
+        if query not in self.queries:
+            self.queries[query] = [
+                index
+                for input, index in self.inputs
+                if input[0].startswith(prefix)
+                and all(c in input[0] for c in query[0])
+                and not any(e in input[excludes_in] for e in query[1])
+            ]
+
+        return self.queries[query]
+
+
+def calculate_chunk_impacts(vm, kwargs: dict):
+    """
+    Build and solve the inventory of a chunk of iterations of the `value` dimension.
+    The first iteration of the chunk is only used to solve the background system,
+    and its results are discarded.
+    Defined at the module level, so that it can be run by a process pool.
+
+    :param vm: :class:`TruckModel` object, restricted to a chunk of iterations
+    :param kwargs: arguments passed to :class:`InventoryTruck`
+    :return: xarray.DataArray
+    """
+
+    inventory = InventoryTruck(vm, **kwargs)
+    results = inventory.calculate_impacts().isel(value=slice(1, None))
+
+    if "fuel_blend" in results.dims:
+        results = results.isel(fuel_blend=0, drop=True)
+
+    return results
+
 
 class InventoryTruck(Inventory):
     """
@@ -21,348 +460,592 @@ class InventoryTruck(Inventory):
 
     """
 
-    def fill_in_A_matrix(self):
+    def __init__(
+        self,
+        vm,
+        *args,
+        chunk_size: int = None,
+        n_workers: int = None,
+        sparse_matrix: bool = False,
+        countries: list = None,
+        fuel_blends: list = None,
+        **kwargs,
+    ) -> None:
         """
-        Fill-in the A matrix. Does not return anything. Modifies in place.
-        Shape of the A matrix (values, products, activities).
+        See :class:`carculator_utils.inventory.Inventory` for other arguments.
 
-        :attr:`array` from :class:`CarModel` class
+        :param vm: :class:`TruckModel` object
+        :param chunk_size: if given, the inventory is built and solved for chunks of
+            `chunk_size` iterations of the `value` dimension at a time, to limit memory use.
+            :attr:`A` then only holds the first chunk, and the following chunks are
+            built by :meth:`calculate_impacts`.
+        :param n_workers: if greater than 1, chunks of iterations are built and solved
+            in parallel by as many processes. If `chunk_size` is not given,
+            the iterations are split evenly between processes.
+        :param sparse_matrix: if True, :attr:`A` is stored as a :class:`SparseAMatrix`,
+            with one sparsity pattern shared by all iterations and years,
+            instead of a dense array.
+        :param countries: if given, the impacts are calculated for each of these
+            countries of use, along a `country` dimension. The inventory is built once,
+            and only its country-specific inputs are updated for each country.
+        :param fuel_blends: if given, list of fuel blends, as passed to :class:`TruckModel`,
+            for which the impacts are calculated, along a `fuel_blend` dimension.
+            The vehicles are not sized again: only the fuel supply and the
+            combustion emissions are updated for each fuel blend.
         """
 
-        # Assembly
-        self.A[
-            :,
-            self.find_input_indices(("assembly operation, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="curb mass") * -1
-        )
+        if "cycle" in vm.array.dims:
+            raise ValueError(
+                "The vehicles are sized for several driving cycles. "
+                "Use `TruckModel.get_cycle()` to select one of them."
+            )
 
-        # Glider/Frame
-        self.A[
-            :,
-            self.find_input_indices(("frame, blanks and saddle, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="glider base mass") * -1
-        )
+        iterations = vm.array.sizes["value"]
+        if n_workers and n_workers > 1 and not chunk_size:
+            chunk_size = -(-iterations // n_workers)
 
-        # Suspension + Brakes
-        self.A[
-            :,
-            self.find_input_indices(("suspension, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(
-                parameter=[
-                    "suspension mass",
-                    "braking system mass",
-                ]
-            ).sum(dim="parameter")
-            * -1
-        )
+        self.n_workers = n_workers
+        self.sparse_matrix = sparse_matrix
+        self.chunks = [
+            slice(start, start + (chunk_size or iterations))
+            for start in range(0, iterations, chunk_size or iterations)
+        ]
+        self.full_vm = vm
+        self.countries = countries
+        self.fuel_blends = fuel_blends
+        # electricity inputs of the background activities,
+        # before they are redirected by the fuel markets
+        self.background_electricity = None
+        self.index = None
 
-        # Wheels and tires
-        self.A[
-            :,
-            self.find_input_indices(("tires and wheels, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="wheels and tires mass") * -1
+        super().__init__(
+            vm.get_chunk(self.chunks[0]) if len(self.chunks) > 1 else vm,
+            *args,
+            **kwargs,
         )
 
-        # Exhaust
-        self.A[
-            :,
-            self.find_input_indices(("exhaust system, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="exhaust system mass") * -1
-        )
+    def get_A_matrix(self):
+        """
+        Load the A matrix. The matrix contains exchanges of products (rows)
+        between activities (columns).
 
-        # Electrical system
-        self.A[
-            :,
-            self.find_input_indices(("power electronics, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="electrical system mass") * -1
-        )
+        :return: A matrix with four dimensions of shape (number of values,
+            number of products, number of activities, number of years),
+            as a dense array or as a :class:`SparseAMatrix`
+        """
 
-        # Transmission (52% transmission shaft, 36% gearbox + 12% retarder)
-        self.A[
-            :,
-            self.find_input_indices(("transmission, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="transmission mass") * 0.52 * -1
-        )
+        if not self.sparse_matrix:
+            return super().get_A_matrix()
 
-        self.A[
-            :,
-            self.find_input_indices(("gearbox, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="transmission mass") * 0.36 * -1
-        )
+        filepath = UTILS_DATA_DIR / "IAM" / "A_matrix.npz"
+        if not filepath.is_file():
+            raise FileNotFoundError("The IAM files could not be found.")
 
-        self.A[
-            :,
-            self.find_input_indices(("retarder, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="transmission mass") * 0.12 * -1
+        initial_A = sparse.load_npz(filepath)
+        size = initial_A.shape[0]
+
+        # activities added to the background system only supply themselves
+        matrix = sparse.block_diag(
+            [initial_A, sparse.identity(len(self.inputs) - size)], format="coo"
         )
 
-        # Other components, for non-electric and hybrid trucks
+        return SparseAMatrix(matrix, self.iterations, len(self.scope["year"]))
 
-        self.A[
-            :,
-            self.find_input_indices(("other components, for hybrid electric lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="other components mass")
-            * (self.array.sel(parameter="combustion power") > 0)
-            * -1
-        )
+    def add_additional_activities(self):
+        """
+        Add the vehicle-specific activities to the inputs of the A matrix,
+        and build :attr:`index` from the completed inputs.
+        """
 
-        # Other components, for electric trucks
-        self.A[
-            :,
-            self.find_input_indices(("other components, for electric lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="other components mass")
-            * (self.array.sel(parameter="combustion power") == 0)
-            * -1
-        )
+        # inputs of the background system (ecoinvent), before foreground activities
+        self.background_size = len(self.inputs)
+        super().add_additional_activities()
+        self.index = InputIndex(self.inputs)
 
-        self.A[
-            :,
-            self.find_input_indices(("glider lightweighting",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="lightweighting")
-            * self.array.sel(parameter="glider base mass")
-            * -1
-        )
+    def change_functional_unit(self) -> None:
+        """
+        Change the functional unit of the transport activities,
+        and rebuild :attr:`index` from the renamed inputs.
+        """
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("maintenance, lorry 16 metric ton",),
-                excludes=("CH",),
-                excludes_in=1,
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = -1 * (
-            self.array.sel(parameter="gross mass")
-            * (self.array.sel(parameter="gross mass") < 26000)
-            / 1000
-            / 16
-        )
+        super().change_functional_unit()
+        self.index = InputIndex(self.inputs)
 
-        self.A[
-            :,
-            self.find_input_indices(contains=("maintenance, lorry 28 metric ton",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = -1 * (
-            self.array.sel(parameter="gross mass")
-            * np.where(self.array.sel(parameter="gross mass") < 26000, 0, 1)
-            * np.where(self.array.sel(parameter="gross mass") >= 40000, 0, 1)
-            / 1000
-            / 28
-        )
+    def find_input_indices(
+        self, contains: [tuple, str], excludes: tuple = (), excludes_in: int = 0
+    ) -> list:
+        """
+        This function finds the indices of the inputs in the A matrix
+        that contain the strings in the contains list, and do not
+        contain the strings in the excludes list.
+        Queries are answered by :attr:`index` once it is built.
 
-        self.A[
-            :,
-            self.find_input_indices(contains=("maintenance, lorry 40 metric ton",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = -1 * (
-            self.array.sel(parameter="gross mass")
-            * (self.array.sel(parameter="gross mass") >= 40000)
-            / 1000
-            / 40
-        )
+        :param contains: list of strings
+        :param excludes: list of strings
+        :param excludes_in: integer of item position to apply excludes filter
+        :return: list of indices
+        """
 
-        # Electric powertrain components
-        self.A[
-            :,
-            self.find_input_indices(
-                ("market for converter, for electric passenger car",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="converter mass") * -1
-        )
+        if self.index is None:
+            return super().find_input_indices(contains, excludes, excludes_in)
 
-        self.A[
-            :,
-            self.find_input_indices(
-                ("market for electric motor, electric passenger car",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="electric engine mass") * -1
-        )
+        indices = self.index.find(contains, excludes, excludes_in)
 
-        self.A[
-            :,
-            self.find_input_indices(
-                ("market for inverter, for electric passenger car",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="inverter mass") * -1
+        if len(indices) == 0:
+            print(
+                f"No input found for {contains} and exclude {excludes} in the A matrix."
+            )
+
+        return indices
+
+    def define_electricity_mix_for_fuel_prep(self) -> np.ndarray:
+        """
+        Define the electricity mix used for fuel preparation.
+        The use period of the vehicles is averaged over all iterations,
+        also when the inventory is built by chunks of iterations.
+
+        :return: electricity mix, for each year
+        """
+
+        if self.full_vm is self.vm:
+            return super().define_electricity_mix_for_fuel_prep()
+
+        array = self.array
+        self.array = format_array(
+            self.full_vm.array.sel(
+                parameter=["lifetime kilometers", "kilometers per year"]
+            )
         )
+        mix = super().define_electricity_mix_for_fuel_prep()
+        self.array = array
+
+        return mix
 
+    def set_country(self, country: str) -> None:
+        """
+        Change the country of use of the vehicles, and update the inputs of the
+        A matrix that depend on it: the electricity mix for fuel preparation and battery
+        charging, and the sulfur dioxide emissions of combustion vehicles.
+        The vehicles are not sized again for this country.
+
+        :param country: ISO code of the country
+        """
+
+        self.vm.country = country
+        self.full_vm.country = country
+
+        self.mix = self.define_electricity_mix_for_fuel_prep()
+        self.create_electricity_mix_for_fuel_prep()
+
+        so2 = self.inputs[("Sulfur dioxide", ("air",), "kilogram")]
         self.A[
-            :,
-            self.find_input_indices(
-                ("market for power distribution unit, for electric passenger car",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="power distribution unit mass") * -1
+            :, so2, self.find_input_indices((f"transport, {self.vm.vehicle_type}, ",))
+        ] = 0
+
+        for fuel, (powertrains, powertrains_short) in COMBUSTION_FUELS.items():
+            if [i for i in self.scope["powertrain"] if i in powertrains]:
+                self.add_sulphur_emissions(fuel, powertrains_short, powertrains)
+
+        self.remove_non_compliant_transport([so2])
+
+    def set_fuel_blend(self, fuel_blend: dict) -> None:
+        """
+        Change the fuel blend of the vehicles, and update the inputs of the
+        A matrix that depend on it: the fuel markets, the fuel supply of the vehicles
+        and their carbon dioxide and sulfur dioxide emissions.
+        The fuel mass of the vehicles is scaled by the lower heating value of the blend,
+        but the vehicles are not sized again for this fuel blend.
+
+        :param fuel_blend: fuel blend, as passed to :class:`TruckModel`.
+            Fuels that are not in `fuel_blend` keep their current blend.
+        """
+
+        fuel_blend = {
+            **self.vm.fuel_blend,
+            **self.vm.check_fuel_blend(copy.deepcopy(fuel_blend)),
+        }
+
+        # as in `VehicleModel.set_average_lhv()`
+        self.array = self.array.copy()
+        for pt, fuel in LHV_POWERTRAINS.items():
+            if pt not in self.scope["powertrain"] or fuel not in fuel_blend:
+                continue
+
+            lhv, density = (
+                sum(
+                    np.array(fuel_blend[fuel][level]["share"])
+                    * fuel_blend[fuel][level].get(
+                        spec,
+                        self.bs.fuel_specs[fuel_blend[fuel][level]["type"]][spec],
+                    )
+                    for level in ["primary", "secondary"]
+                )
+                * np.ones(len(self.scope["year"]))
+                for spec in ["lhv", "density"]
+            )
+
+            vehicles = [
+                d
+                for d in self.array.coords["combined_dim"].values
+                if d.endswith(f" - {pt}")
+            ]
+            current = self.array.loc[dict(combined_dim=vehicles)]
+            current_lhv = current.sel(parameter="LHV fuel MJ per kg")
+            current_density = current.sel(parameter="fuel density per kg")
+
+            ratio = xr.where(current_lhv > 0, current_lhv / lhv, 0)
+            self.array.loc[dict(combined_dim=vehicles, parameter="fuel mass")] = (
+                current.sel(parameter="fuel mass") * ratio
+            )
+            self.array.loc[
+                dict(combined_dim=vehicles, parameter="fuel consumption")
+            ] = (
+                current.sel(parameter="fuel consumption")
+                * ratio
+                * xr.where(density > 0, current_density / density, 0)
+            )
+            self.array.loc[
+                dict(combined_dim=vehicles, parameter="LHV fuel MJ per kg")
+            ] = lhv
+            self.array.loc[
+                dict(combined_dim=vehicles, parameter="fuel density per kg")
+            ] = density
+
+        # remove the fuels of the current blend from the fuel markets,
+        # and restore the electricity inputs they redirected
+        for fuel in self.vm.fuel_blend:
+            market = self.find_input_indices((f"fuel supply for {fuel} vehicles",))
+            for level in ["primary", "secondary"]:
+                self.A[
+                    :, self.inputs[self.vm.fuel_blend[fuel][level]["name"]], market
+                ] = 0
+
+        rows, electricity = self.background_electricity
+        self.A[:, rows, : self.background_size] = electricity
+
+        self.vm.fuel_blend = fuel_blend
+        self.full_vm.fuel_blend = fuel_blend
+
+        # the fuel markets are created as when the inventory is built,
+        # before the vehicles are added to the A matrix
+        vehicles = self.index.find(
+            prefix=f"{self.vm.vehicle_type}, "
+        ) + self.index.find(prefix=f"transport, {self.vm.vehicle_type}, ")
+        columns = self.A[:, :, vehicles]
+        self.A[:, :, vehicles] = 0
+        self.A[:, vehicles, vehicles] = 1
+        self.create_fuel_markets()
+        self.A[:, :, vehicles] = columns
+
+        self.add_hydrogen_to_fuel_cell_vehicles()
+        self.add_fuel_to_vehicles("methane", *COMBUSTION_FUELS["methane"])
+        self.add_fuel_leakage()
+        self.add_fuel_to_vehicles("diesel", *COMBUSTION_FUELS["diesel"])
+
+        self.remove_non_compliant_transport(
+            self.find_input_indices(("fuel supply for ",))
+            + [
+                self.inputs[(name, ("air",), "kilogram")]
+                for name in [
+                    "Carbon dioxide, fossil",
+                    "Carbon dioxide, non-fossil",
+                    "Sulfur dioxide",
+                ]
+            ]
         )
 
-        self.A[
-            :,
-            self.find_input_indices(("internal combustion engine, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            self.array.sel(parameter="combustion engine mass") * -1
+    def remove_non_compliant_transport(self, rows: list) -> None:
+        """
+        Remove the inputs in `rows` of the transport activities
+        of vehicles that do not have a TtW energy superior to 0,
+        as in :meth:`remove_non_compliant_vehicles`.
+
+        :param rows: indices of the inputs
+        """
+
+        idx = np.ix_(
+            np.arange(self.iterations),
+            rows,
+            self.find_input_indices((f"transport, {self.vm.vehicle_type}, ",)),
+        )
+        self.A[idx] = (
+            np.nan_to_num(self.A[idx])
+            * (self.array.sel(parameter=["TtW energy"]) > 0).values
         )
 
-        # Energy storage
-        self.add_fuel_cell_stack()
-        self.add_hydrogen_tank()
-        self.add_battery()
+    def create_fuel_markets(self):
+        """
+        Create the fuel markets of the fuel blends. If the impacts are calculated
+        for several fuel blends, the electricity inputs of the background activities
+        are kept beforehand, to be restored when the fuel blend changes.
+        """
 
-        # Use the inventory of Wolff et al. 2020 for
-        # lead acid battery for non-electric
-        # and non-hybrid trucks
-        self.A[
-            :,
-            self.find_input_indices(("lead acid battery, for lorry",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = (
-            16.0  # kg/battery
-            * (
-                self.array.sel(parameter="lifetime kilometers")
-                / self.array.sel(parameter="kilometers per year")
-                / 5  # years
+        if self.fuel_blends and self.background_electricity is None:
+            rows = [
+                i for k, i in self.inputs.items() if "kilowatt hour" in k[2].lower()
+            ]
+            self.background_electricity = (
+                rows,
+                self.A[:, rows, : self.background_size],
             )
-            * (self.array.sel(parameter="combustion power") > 0)
-        ) * -1
 
-        # Fuel tank for diesel trucks
-        self.A[
-            :,
-            self.find_input_indices(("fuel tank, for diesel vehicle",)),
-            [
-                j
-                for i, j in self.inputs.items()
-                if i[0].startswith("truck, ")
-                and "EV-d" in i[0]
-                and "battery" not in i[0]
-            ],
-        ] = (
-            self.array.sel(
-                parameter="fuel tank mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if any(x in d for x in ["ICEV-d", "HEV-d"])
-                ],
+        super().create_fuel_markets()
+
+    def calculate_impacts(self, sensitivity=False):
+        """
+        Calculate the impacts of the vehicles, for each iteration of the `value` dimension.
+        If `countries` or `fuel_blends` were given, the impacts are calculated
+        for each country and fuel blend in turn, along a `country`
+        and a `fuel_blend` dimension.
+
+        :param sensitivity: if True, the results are formatted for a sensitivity analysis
+        :return: xarray.DataArray
+        """
+
+        if not self.countries and not self.fuel_blends:
+            return self.solve_chunks(sensitivity=sensitivity)
+
+        country, fuel_blend, array = self.vm.country, self.vm.fuel_blend, self.array
+        results = []
+
+        try:
+            for c in self.countries or [country]:
+                self.set_country(c)
+                if not self.fuel_blends:
+                    results.append(self.solve_chunks(sensitivity=sensitivity))
+                    continue
+
+                blend_results = []
+                for fb in self.fuel_blends:
+                    self.set_fuel_blend(fb)
+                    blend_results.append(self.solve_chunks(sensitivity=sensitivity))
+                results.append(
+                    xr.concat(blend_results, dim="fuel_blend").assign_coords(
+                        fuel_blend=np.arange(len(self.fuel_blends))
+                    )
+                )
+        finally:
+            if self.fuel_blends:
+                self.array = array
+                self.set_fuel_blend(fuel_blend)
+            self.set_country(country)
+
+        if not self.countries:
+            return results[0]
+
+        return xr.concat(results, dim="country").assign_coords(country=self.countries)
+
+    def solve_chunks(self, sensitivity=False):
+        """
+        Calculate the impacts of the vehicles, for each iteration of the `value` dimension.
+        If the inventory is built by chunks of iterations, the inventory of each
+        chunk is built and solved in turn, or in parallel if `n_workers` is greater
+        than 1, and the results are concatenated.
+
+        :param sensitivity: if True, the results are formatted for a sensitivity analysis
+        :return: xarray.DataArray
+        """
+
+        if len(self.chunks) == 1:
+            return self.solve_impacts(sensitivity=sensitivity)
+
+        if sensitivity:
+            raise ValueError(
+                "Sensitivity analyses are normalized by the reference iteration "
+                "and cannot be calculated by chunks of iterations."
             )
-            * -1
+
+        # the background system is solved with the first iteration:
+        # it is prepended to each chunk, and its results discarded
+        iterations = np.arange(self.full_vm.array.sizes["value"])
+        chunks = (
+            self.full_vm.get_chunk(np.r_[0, iterations[values]])
+            for values in self.chunks[1:]
         )
+        kwargs = {
+            "background_configuration": {
+                **self.background_configuration,
+                "custom electricity mix": self.mix,
+            },
+            "scenario": self.scenario,
+            "method": self.method,
+            "indicator": self.indicator,
+            "functional_unit": self.func_unit,
+            "sparse_matrix": self.sparse_matrix,
+        }
+        if self.fuel_blends:
+            kwargs["fuel_blends"] = [self.vm.fuel_blend]
 
-        self.add_cng_tank()
+        if self.n_workers and self.n_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                chunk_results = executor.map(
+                    calculate_chunk_impacts, chunks, repeat(kwargs)
+                )
+                results = [self.solve_impacts(), *chunk_results]
+        else:
+            results = [self.solve_impacts()]
+            results.extend(calculate_chunk_impacts(chunk, kwargs) for chunk in chunks)
 
-        # End-of-life disposal and treatment
+        results = xr.concat(results, dim="value")
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("treatment of used lorry, 16 metric ton",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = 1 * (
-            self.array.sel(parameter="gross mass")
-            * (self.array.sel(parameter="gross mass") < 26000)
-            / 1000
-            / 16
-        )
+        return results.assign_coords(value=np.arange(results.sizes["value"]))
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("treatment of used lorry, 28 metric ton",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = -1 * (
-            self.array.sel(parameter="gross mass")
-            * np.where(self.array.sel(parameter="gross mass") < 26000, 0, 1)
-            * np.where(self.array.sel(parameter="gross mass") >= 40000, 0, 1)
-            / 1000
-            / 28
+    def add_vehicle_components(self):
+        """
+        Add the components of the vehicles, described in `VEHICLE_COMPONENTS`,
+        as inputs of the truck activities. The parameters needed are selected
+        once, and the amounts of all inputs are written into the A matrix at once.
+        Does not return anything. Modifies :attr:`A` in place.
+        """
+
+        parameters = list(
+            {
+                parameter
+                for component in VEHICLE_COMPONENTS
+                for key in ["parameters", "scaling", "divisor"]
+                for parameter in component.get(key, [])
+            }
+            | {"gross mass", "combustion power"}
         )
+        position = {parameter: p for p, parameter in enumerate(parameters)}
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("treatment of used lorry, 40 metric ton",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-        ] = -1 * (
-            self.array.sel(parameter="gross mass")
-            * (self.array.sel(parameter="gross mass") >= 40000)
-            / 1000
-            / 40
+        # shape (parameter, value, combined_dim, year)
+        values = (
+            self.array.sel(parameter=parameters)
+            .transpose("parameter", "value", "combined_dim", "year")
+            .values
+        )
+        gross_mass = values[position["gross mass"]]
+        has_combustion_engine = values[position["combustion power"]] > 0
+        powertrains = np.array(
+            [d.split(" - ")[-1] for d in self.array.coords["combined_dim"].values]
         )
 
-        # END of vehicle building
+        rows, amounts = [], []
 
-        # Add vehicle dataset to transport dataset
-        self.add_vehicle_to_transport_dataset()
+        for component in VEHICLE_COMPONENTS:
+            amount = values[
+                [position[parameter] for parameter in component["parameters"]]
+            ].sum(axis=0)
 
-        self.display_renewable_rate_in_mix()
+            for parameter in component.get("scaling", []):
+                amount = amount * values[position[parameter]]
 
-        self.add_electricity_to_electric_vehicles()
+            for parameter in component.get("divisor", []):
+                amount = amount / values[position[parameter]]
 
-        self.add_hydrogen_to_fuel_cell_vehicles()
+            amount = amount * component["factor"]
+
+            if "combustion" in component:
+                amount = amount * (has_combustion_engine == component["combustion"])
 
-        self.add_fuel_to_vehicles("methane", ["ICEV-g"], "EV-g")
+            if "gross mass" in component:
+                lower, upper = component["gross mass"]
+                amount = amount * ((gross_mass >= lower) & (gross_mass < upper))
+
+            if "powertrains" in component:
+                amount = np.where(
+                    np.isin(powertrains, component["powertrains"])[None, :, None],
+                    amount,
+                    0,
+                )
+
+            for row in self.find_input_indices(
+                contains=component["activity"],
+                excludes=component.get("excludes", ()),
+                excludes_in=component.get("excludes_in", 0),
+            ):
+                rows.append(row)
+                amounts.append(amount)
 
-        # CNG pump-to-tank leakage
         self.A[
             :,
-            self.find_input_indices(("fuel supply for methane vehicles",)),
-            self.find_input_indices((f"transport, {self.vm.vehicle_type}, ",)),
-        ] *= 1 + self.array.sel(parameter="CNG pump-to-tank leakage")
+            np.array(rows)[:, None],
+            np.array(self.index.find(prefix="truck, "))[None, :],
+        ] = np.stack(amounts, axis=1)
+
+    def solve_impacts(self, sensitivity=False):
+        """
+        Calculate the impacts of the vehicles, for each iteration of the `value` dimension,
+        with :meth:`carculator_utils.inventory.Inventory.calculate_impacts`. The A matrix
+        of the first iteration is factorised once per year, for all the inputs the base
+        method solves for (see :class:`TechnosphereFactorisation`
+        and :func:`factorised_technosphere`).
+
+        :param sensitivity: if True, the results are formatted for a sensitivity analysis
+        :return: xarray.DataArray
+        """
+
+        with factorised_technosphere(self):
+            return super().calculate_impacts(sensitivity=sensitivity)
+
+    def add_fuel_leakage(self):
+        """
+        Add the CNG pump-to-tank leakage to the methane supply of the vehicles.
+        """
 
-        # Gas leakage to air
         self.A[
             :,
-            self.inputs[("Methane, fossil", ("air",), "kilogram")],
-            self.find_input_indices((f"transport, {self.vm.vehicle_type}",)),
+            self.find_input_indices(("fuel supply for methane vehicles",)),
+            self.find_input_indices((f"transport, {self.vm.vehicle_type}, ",)),
         ] *= 1 + self.array.sel(parameter="CNG pump-to-tank leakage")
 
-        self.add_fuel_to_vehicles("diesel", ["ICEV-d", "PHEV-d", "HEV-d"], "EV-d")
+    def fill_in_A_matrix(self):
+        """
+        Fill-in the A matrix. Does not return anything. Modifies in place.
+        Shape of the A matrix (values, products, activities).
+
+        :attr:`array` from :class:`CarModel` class
+        """
+
+        # Vehicle components, energy storage
+        # and vehicle dataset added to transport dataset
+        for step in [
+            self.add_vehicle_components,
+            self.add_fuel_cell_stack,
+            self.add_hydrogen_tank,
+            self.add_battery,
+            self.add_cng_tank,
+            self.add_vehicle_to_transport_dataset,
+        ]:
+            with stage(step.__name__, self.A):
+                step()
+
+        self.display_renewable_rate_in_mix()
 
-        self.add_abrasion_emissions()
+        for step in [
+            self.add_electricity_to_electric_vehicles,
+            self.add_hydrogen_to_fuel_cell_vehicles,
+        ]:
+            with stage(step.__name__, self.A):
+                step()
 
-        self.add_road_construction()
+        with stage("add_fuel_to_vehicles: methane", self.A):
+            self.add_fuel_to_vehicles("methane", *COMBUSTION_FUELS["methane"])
 
-        self.add_road_maintenance()
+        with stage("add_fuel_leakage", self.A):
+            self.add_fuel_leakage()
 
-        self.add_exhaust_emissions()
+            # Gas leakage to air
+            self.A[
+                :,
+                self.inputs[("Methane, fossil", ("air",), "kilogram")],
+                self.find_input_indices((f"transport, {self.vm.vehicle_type}",)),
+            ] *= 1 + self.array.sel(parameter="CNG pump-to-tank leakage")
 
-        self.add_noise_emissions()
+        with stage("add_fuel_to_vehicles: diesel", self.A):
+            self.add_fuel_to_vehicles("diesel", *COMBUSTION_FUELS["diesel"])
 
-        self.add_refrigerant_emissions()
+        for step in [
+            self.add_abrasion_emissions,
+            self.add_road_construction,
+            self.add_road_maintenance,
+            self.add_exhaust_emissions,
+            self.add_noise_emissions,
+            self.add_refrigerant_emissions,
+        ]:
+            with stage(step.__name__, self.A):
+                step()
 
         # Charging infrastructure
         # Plugin BEV trucks
@@ -370,25 +1053,26 @@ class InventoryTruck(Inventory):
         # Hence, we calculate the lifetime of the truck
         # We assume two trucks per charging station
 
-        self.A[
-            np.ix_(
-                np.arange(self.iterations),
-                self.find_input_indices(
-                    ("EV charger, level 3, plugin, 200 kW",),
-                ),
-                [j for i, j in self.inputs.items() if i[0].startswith("truck, ")],
-            )
-        ] = (
-            -1
-            / (
-                self.array.sel(
-                    parameter=["kilometers per year"],
+        with stage("charging infrastructure", self.A):
+            self.A[
+                np.ix_(
+                    np.arange(self.iterations),
+                    self.find_input_indices(
+                        ("EV charger, level 3, plugin, 200 kW",),
+                    ),
+                    self.index.find(prefix="truck, "),
                 )
-                * 2
-                * 24
+            ] = (
+                -1
+                / (
+                    self.array.sel(
+                        parameter=["kilometers per year"],
+                    )
+                    * 2
+                    * 24
+                )
+            ) * (
+                self.array.sel(parameter="combustion power") == 0
             )
-        ) * (
-            self.array.sel(parameter="combustion power") == 0
-        )
 
         print("*********************************************************************")
@@ -1,8 +1,15 @@
+import copy
+import hashlib
 import warnings
-from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import product, repeat
+from pathlib import Path
+from types import MappingProxyType
 
-import numexpr as ne
 import numpy as np
+import pandas as pd
 import xarray as xr
 import yaml
 from carculator_utils.energy_consumption import (
@@ -13,16 +20,681 @@ from carculator_utils.model import VehicleModel
 from prettytable import PrettyTable
 
 from . import DATA_DIR
+from .array_view import ArrayIndex, ArrayView
+from .profiling import stage
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 CARGO_MASSES = DATA_DIR / "payloads.yaml"
 
+SIZING_SOLVERS = ("fixed-point", "secant")
+
+# methods run once the vehicles are sized, in order
+POST_SIZING_STEPS = [
+    "set_battery_fuel_cell_replacements",
+    "set_electric_utility_factor",
+    "set_electricity_consumption",
+    "set_costs",
+    "set_particulates_emission",
+    "set_noise_emissions",
+    "set_hot_emissions",
+    "create_PHEV",
+    "drop_hybrid",
+    "remove_energy_consumption_from_unavailable_vehicles",
+]
+
+# Parameters read or calculated while sizing the vehicles: once they are sized,
+# a change to any of them calls for sizing the vehicles again
+SIZING_INPUTS = frozenset(
+    [
+        "CNG engine efficiency correction factor",
+        "LHV fuel MJ per kg",
+        "TtW efficiency",
+        "TtW energy",
+        "TtW energy, combustion mode",
+        "TtW energy, electric mode",
+        "aerodynamic drag coefficient",
+        "auxiliary energy",
+        "auxiliary power demand",
+        "auxilliary power base demand",
+        "available payload",
+        "average passenger mass",
+        "average passengers",
+        "battery BoP mass",
+        "battery DoD",
+        "battery cell energy density",
+        "battery cell mass",
+        "battery cell mass share",
+        "battery cell power density",
+        "battery charge efficiency",
+        "battery discharge efficiency",
+        "battery power",
+        "braking system mass",
+        "cabin mass",
+        "cargo mass",
+        "charger mass",
+        "combustion engine mass",
+        "combustion power",
+        "combustion power share",
+        "converter mass",
+        "cooling energy consumption",
+        "cooling thermal demand",
+        "curb mass",
+        "driving mass",
+        "electric energy stored",
+        "electric engine mass",
+        "electric power",
+        "electrical system mass",
+        "energy battery mass",
+        "engine efficiency",
+        "engine fixed mass",
+        "engine mass per power",
+        "exhaust system mass",
+        "frontal area",
+        "fuel cell ancillary BoP mass",
+        "fuel cell ancillary BoP mass per power",
+        "fuel cell essential BoP mass",
+        "fuel cell essential BoP mass per power",
+        "fuel cell own consumption",
+        "fuel cell power",
+        "fuel cell power area density",
+        "fuel cell power density",
+        "fuel cell power share",
+        "fuel cell stack efficiency",
+        "fuel cell stack mass",
+        "fuel cell system efficiency",
+        "fuel density per kg",
+        "fuel mass",
+        "fuel tank mass",
+        "glider base mass",
+        "gross mass",
+        "heating energy consumption",
+        "heating thermal demand",
+        "inverter fix mass",
+        "inverter mass",
+        "inverter mass per power",
+        "lightweighting",
+        "other components mass",
+        "oxidation energy stored",
+        "power",
+        "power distribution unit mass",
+        "power to mass ratio",
+        "recuperation efficiency",
+        "rolling resistance coefficient",
+        "share recuperated energy",
+        "suspension mass",
+        "target range",
+        "total cargo mass",
+        "transmission efficiency",
+        "transmission mass",
+        "transmission mass per ton of gross weight",
+        "wheels and tires mass",
+    ]
+)
+
+# Parameters read and written by the steps run once the vehicles are sized,
+# in the order in which they run (see `POST_SIZING_STEPS`), used by
+# :meth:`TruckModel.recompute` to only run the steps affected by a change.
+# None stands for all parameters. Emissions are not listed, as they are
+# only read by `create_PHEV`.
+STEP_PARAMETERS = {
+    "set_battery_fuel_cell_replacements": {
+        "reads": {
+            "TtW energy",
+            "battery cycle life",
+            "charger mass",
+            "electric energy stored",
+            "fuel cell lifetime hours",
+            "lifetime kilometers",
+        },
+        "writes": {
+            "battery lifetime replacements",
+            "fuel cell lifetime replacements",
+        },
+    },
+    "set_electric_utility_factor": {
+        "reads": {
+            "TtW energy",
+            "battery DoD",
+            "electric energy stored",
+            "target range",
+        },
+        "writes": {
+            "electric utility factor",
+        },
+    },
+    "set_electricity_consumption": {
+        "reads": {
+            "TtW energy",
+            "battery charge efficiency",
+            "charger efficiency",
+            "charger mass",
+            "fuel density per kg",
+            "fuel mass",
+            "target range",
+        },
+        "writes": {
+            "electricity consumption",
+            "fuel consumption",
+        },
+    },
+    "set_costs": {
+        "reads": {
+            "TtW energy",
+            "adblue cost per kg",
+            "battery charge efficiency",
+            "battery lifetime replacements",
+            "battery onboard charging infrastructure cost",
+            "battery power",
+            "braking system mass",
+            "cabin mass",
+            "cargo mass",
+            "combustion exhaust treatment cost",
+            "combustion power",
+            "combustion powertrain cost per kW",
+            "electric energy stored",
+            "electric power",
+            "electric powertrain cost per kW",
+            "energy battery cost per kWh",
+            "energy cost per kWh",
+            "fuel cell cost per kW",
+            "fuel cell lifetime replacements",
+            "fuel cell power",
+            "fuel mass",
+            "fuel tank cost per kg",
+            "glider base mass",
+            "glider lightweighting cost per kg",
+            "heat pump cost",
+            "insurance cost per year",
+            "interest rate",
+            "kilometers per year",
+            "lifetime kilometers",
+            "lightweighting",
+            "maintenance cost per km",
+            "markup factor",
+            "power battery cost per kW",
+            "suspension mass",
+            "target range",
+            "toll cost per km",
+            "wheels and tires mass",
+        },
+        "writes": {
+            "adblue cost",
+            "amortised component replacement cost",
+            "amortised purchase cost",
+            "combustion powertrain cost",
+            "component replacement cost",
+            "electric powertrain cost",
+            "energy battery cost",
+            "energy cost",
+            "fuel cell cost",
+            "fuel tank cost",
+            "glider cost",
+            "insurance cost",
+            "lifetime",
+            "lightweighting cost",
+            "maintenance cost",
+            "power battery cost",
+            "purchase cost",
+            "toll cost",
+            "total cost per km",
+        },
+    },
+    "set_particulates_emission": {
+        "reads": {
+            "driving mass",
+            "share recuperated energy",
+        },
+        "writes": {
+            "brake wear emissions",
+            "road dust emissions",
+            "road wear emissions",
+            "tire wear emissions",
+        },
+    },
+    "set_noise_emissions": {
+        "reads": set(),
+        "writes": set(),
+    },
+    "set_hot_emissions": {
+        "reads": {
+            "kilometers per year",
+            "lifetime kilometers",
+        },
+        "writes": set(),
+    },
+    "create_PHEV": {"reads": None, "writes": None},
+    "drop_hybrid": {"reads": None, "writes": None},
+    "remove_energy_consumption_from_unavailable_vehicles": {
+        "reads": {
+            "TtW energy",
+            "driving mass",
+            "gross mass",
+            "is_available",
+            "is_compliant",
+        },
+        "writes": {"TtW energy", "is_available", "is_compliant"},
+    },
+}
+
+# Energy consumption models only depend on the sizes, powertrains, driving cycle,
+# gradient and country they are built for, so that models re-run with other
+# parameters reuse them. The least recently used one is dropped when full.
+ENERGY_CONSUMPTION_MODELS = {}
+MAX_ENERGY_CONSUMPTION_MODELS = 32
+
+# attributes of a model that hold results along the `value` dimension, besides `array`
+RESULT_ATTRIBUTES = [
+    "energy",
+    "energy_profile",
+    "sizing_iterations",
+    "hybrids",
+    "ttw_energy",
+]
+
+# outputs of the energy consumption model that are summed over the driving cycle
+ENERGY_SUMS = [
+    "motive energy at wheels",
+    "motive energy",
+    "negative motive energy",
+    "recuperated energy",
+    "auxiliary energy",
+    "velocity",
+]
+# outputs of the energy consumption model that are averaged
+# over the seconds where the powertrain is under load
+ENERGY_MEANS = ["transmission efficiency", "engine efficiency"]
+# outputs of the energy consumption model summed into the energy consumption kept
+# for each second of the driving cycle, as read by the emission methods
+# of `carculator_utils.model.VehicleModel` (see `EnergyProfile`)
+ENERGY_CONSUMPTION = ["motive energy", "auxiliary energy", "recuperated energy"]
+# steps that read the energy consumption of each second of the driving cycle
+PER_SECOND_STEPS = [
+    "set_hot_emissions",
+    "set_particulates_emission",
+    "set_noise_emissions",
+]
+# steps that only depend on the year and the iteration, and not on the
+# driving cycle: run once for all driving cycles (see `TruckModel.set_all_by_cycles`)
+CYCLE_INDEPENDENT_STEPS = ["adjust_cost"]
+
+# parameter of each cost type returned by `TruckModel.calculate_cost_impacts`
+COST_TYPES = {
+    "purchase": "amortised purchase cost",
+    "maintenance": "maintenance cost",
+    "insurance": "insurance cost",
+    "toll": "toll cost",
+    "component replacement": "amortised component replacement cost",
+    "energy": "energy cost",
+    "total": "total cost per km",
+}
+# parameters that `TruckModel.calculate_cost_sweep` can sweep: they are only
+# read by the calculation of the costs per km, once the costs of components are known
+COST_SWEEP_PARAMETERS = [
+    "interest rate",
+    "energy cost per kWh",
+    "kilometers per year",
+    "maintenance cost per km",
+    "insurance cost per year",
+    "toll cost per km",
+    "adblue cost per kg",
+]
+# parameters read by `get_costs_per_km`
+COST_PER_KM_INPUTS = COST_SWEEP_PARAMETERS + [
+    "cargo mass",
+    "lifetime kilometers",
+    "purchase cost",
+    "component replacement cost",
+    "fuel mass",
+    "target range",
+    "TtW energy",
+]
+
 
 def finite(array, mask_value=0):
     return np.where(np.isfinite(array), array, mask_value)
 
 
+def secant_update(x, f, x_prev, f_prev, fallback):
+    """
+    Secant step on the residual `f` = g(`x`) - `x` of a fixed-point problem,
+    calculated element-wise from two successive iterates.
+    Where the secant slope is undefined or does not indicate a
+    converging fixed-point map, `fallback` is returned instead.
+
+    :param x: current iterate
+    :param f: residual at the current iterate
+    :param x_prev: previous iterate
+    :param f_prev: residual at the previous iterate
+    :param fallback: value to use where the secant step is not applicable
+    :return: next iterate
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (f - f_prev) / (x - x_prev)
+        step = x - f / slope
+
+    # the slope of the residual of a contracting map lies in ]-2, 0[
+    valid = np.isfinite(step) & (slope < -0.1) & (slope > -2)
+
+    return np.where(valid, np.clip(step, 0, None), fallback)
+
+
+def get_costs_per_km(inputs: dict) -> dict:
+    """
+    Calculate the costs per km and per ton-km of the vehicles, once the costs of
+    components are known. Used by :meth:`TruckModel.set_costs`, and by
+    :func:`calculate_costs_per_km` for cost sweeps.
+
+    :param inputs: values of the parameters in `COST_PER_KM_INPUTS`, and the efficiency
+        of battery charging, as `charge efficiency` (1 for vehicles without a battery
+        charged from the grid), as NumPy arrays broadcast against one another
+    :return: values of the parameters written, by name: `lifetime`, `adblue cost`
+        (per km), and the cost parameters of `COST_TYPES` (per ton-km)
+    """
+
+    cargo = inputs["cargo mass"] / 1000
+    km_per_year = inputs["kilometers per year"]
+    i = inputs["interest rate"]
+    lifetime = inputs["lifetime kilometers"] / km_per_year
+
+    # the amortisation factor tends to 1 / lifetime when the interest rate tends to 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortisation_factor = np.where(
+            i == 0, 1 / lifetime, i + (i / ((1 + i) ** lifetime - 1))
+        )
+
+    costs = {
+        "lifetime": lifetime,
+        "adblue cost": inputs["adblue cost per kg"]
+        * 0.06
+        * inputs["fuel mass"]
+        / inputs["target range"],
+        "amortised purchase cost": inputs["purchase cost"]
+        * amortisation_factor
+        / cargo
+        / km_per_year,
+        "insurance cost": inputs["insurance cost per year"] / cargo / km_per_year,
+        "toll cost": inputs["toll cost per km"] / cargo,
+        # simple assumption that component replacement occurs at half of life.
+        "amortised component replacement cost": inputs["component replacement cost"]
+        * ((1 - i) ** lifetime / 2)
+        * amortisation_factor
+        / km_per_year
+        / cargo,
+        "energy cost": inputs["energy cost per kWh"]
+        * inputs["TtW energy"]
+        / 3600
+        / cargo
+        / inputs["charge efficiency"],
+    }
+    costs["maintenance cost"] = (
+        inputs["maintenance cost per km"] + costs["adblue cost"]
+    ) / cargo
+    costs["total cost per km"] = sum(
+        costs[parameter]
+        for parameter in COST_TYPES.values()
+        if parameter != "total cost per km"
+    )
+
+    return costs
+
+
+def calculate_costs_per_km(inputs: dict) -> xr.DataArray:
+    """
+    Calculate the costs per ton-km of each cost type (see `COST_TYPES`),
+    as :meth:`TruckModel.set_costs` does, with :func:`get_costs_per_km`.
+    Inputs are broadcast against one another, following xarray rules.
+
+    :param inputs: values of the parameters in `COST_PER_KM_INPUTS`, and of
+        `charge efficiency` (the efficiency of battery charging, or 1),
+        as xarray.DataArray objects
+    :return: costs per ton-km, along a `cost_type` dimension
+    """
+
+    names = list(inputs)
+    arrays = xr.broadcast(*(inputs[name] for name in names))
+    costs = get_costs_per_km({name: a.values for name, a in zip(names, arrays)})
+
+    return xr.concat(
+        [arrays[0].copy(data=costs[parameter]) for parameter in COST_TYPES.values()],
+        dim="cost_type",
+    ).assign_coords(cost_type=list(COST_TYPES))
+
+
+def get_affected_steps(steps: list, changed: set) -> list:
+    """
+    Return the steps that read a changed parameter, directly or through the
+    parameters written by the steps that run before them (see `STEP_PARAMETERS`).
+
+    :param steps: names of the steps, in the order in which they run
+    :param changed: names of the changed parameters
+    :return: names of the affected steps, in the same order
+    """
+
+    changed = set(changed)
+    affected = []
+    everything = False
+
+    for step in steps:
+        reads, writes = STEP_PARAMETERS[step]["reads"], STEP_PARAMETERS[step]["writes"]
+
+        if everything or (changed and (reads is None or not reads.isdisjoint(changed))):
+            affected.append(step)
+            # steps that write all parameters affect all the steps that follow
+            everything |= writes is None
+            changed |= writes or set()
+
+    return affected
+
+
+def calculate_chunk(chunk: "TruckModel", kwargs: dict) -> "TruckModel":
+    """
+    Size the vehicles of a chunk of iterations of the `value` dimension.
+    Defined at the module level, so that it can be run by a process pool.
+    The energy consumption of each second of the driving cycle is dropped
+    once the emissions of the chunk are calculated, so that it is not kept
+    for all iterations (see :meth:`TruckModel.set_all_by_chunks`).
+
+    :param chunk: :class:`TruckModel` object, restricted to a chunk of iterations
+    :param kwargs: arguments passed to :meth:`TruckModel.calculate_vehicles`
+    :return: the sized :class:`TruckModel` object
+    """
+
+    chunk.calculate_vehicles(**kwargs)
+    chunk.energy_profile = None
+    return chunk
+
+
+def cycle_key(cycle):
+    """
+    Return a hashable key for a driving cycle or a road gradient,
+    given either as a name or as an array.
+
+    :param cycle: name of the driving cycle, array or None
+    :return: hashable key
+    """
+
+    if isinstance(cycle, np.ndarray):
+        cycle = np.ascontiguousarray(cycle)
+        return cycle.shape, cycle.dtype.str, hashlib.sha1(cycle.tobytes()).hexdigest()
+
+    return cycle
+
+
+@lru_cache(maxsize=None)
+def load_cargo_masses(filepath: Path) -> MappingProxyType:
+    """
+    Load the payloads and annual mileages of a file formatted as
+    `data/payloads.yaml`, once per process for a given file.
+    The tables returned are shared by all models, and are read-only.
+
+    :param filepath: path to the file
+    :return: mapping of the tables (e.g., `payload` and `annual mileage`),
+        with values given for each driving cycle and size
+    """
+
+    with open(filepath, "r", encoding="utf-8") as stream:
+        tables = yaml.safe_load(stream)
+
+    return MappingProxyType(
+        {
+            table: MappingProxyType(
+                {
+                    cycle: MappingProxyType(dict(values))
+                    for cycle, values in cycles.items()
+                }
+            )
+            for table, cycles in tables.items()
+        }
+    )
+
+
+def align_to_coordinates(values, array: xr.DataArray) -> np.ndarray:
+    """
+    Return values given for each (powertrain, size, year) combination
+    as an array aligned to the coordinates of `array`.
+
+    :param values: dictionary with (powertrain, size, year) tuples as keys,
+        or pandas Series (or single-column DataFrame) with a
+        (powertrain, size, year) MultiIndex
+    :param array: array of the vehicle model
+    :return: array of shape (size, powertrain, year)
+    :raises KeyError: if a combination of `array` is missing from `values`
+    """
+
+    if isinstance(values, pd.DataFrame):
+        if values.shape[1] != 1:
+            raise ValueError("A DataFrame of values must have a single column.")
+        values = values.iloc[:, 0]
+
+    if not isinstance(values, pd.Series):
+        values = pd.Series(values, dtype=float)
+
+    sizes, powertrains, years = (
+        array.coords[dim].values.tolist() for dim in ("size", "powertrain", "year")
+    )
+    index = pd.MultiIndex.from_product([powertrains, sizes, years])
+    if set(values.index.names) == {"powertrain", "size", "year"}:
+        values = values.reorder_levels(["powertrain", "size", "year"])
+    values = values.reindex(index)
+
+    if values.isna().any():
+        missing = values.index[values.isna()].tolist()
+        raise KeyError(f"No values given for {missing[:5]}.")
+
+    return (
+        values.to_numpy(dtype=float)
+        .reshape(len(powertrains), len(sizes), len(years))
+        .transpose(1, 0, 2)
+    )
+
+
+def split_driving_cycle(ecm: EnergyConsumptionModel, chunk_size: int):
+    """
+    Yield shallow copies of an energy consumption model, each restricted
+    to `chunk_size` consecutive seconds of the driving cycle.
+    Velocity, acceleration and driving time are sliced from the
+    arrays calculated over the entire driving cycle, so that the
+    energy consumption of each second is unchanged.
+
+    :param ecm: :class:`EnergyConsumptionModel` object
+    :param chunk_size: number of seconds per chunk
+    """
+
+    for start in range(0, ecm.velocity.shape[0], chunk_size):
+        chunk = copy.copy(ecm)
+        for attr in ["cycle", "gradient", "velocity", "acceleration", "driving_time"]:
+            setattr(chunk, attr, getattr(ecm, attr)[start : start + chunk_size])
+        yield chunk
+
+
+def reduce_motive_energy(energies) -> xr.DataArray:
+    """
+    Reduce the second-by-second outputs of the energy consumption model
+    to the values the truck model needs: sums over the driving cycle
+    (see `ENERGY_SUMS`) and efficiencies averaged over the seconds where
+    the powertrain is under load (see `ENERGY_MEANS`).
+    A `second` dimension of length 1 is kept, so that the result can be
+    summed over time like the second-by-second outputs.
+
+    :param energies: outputs of the energy consumption model, for consecutive parts of the driving cycle
+    :return: DataArray with dimensions (second, value, year, powertrain, size, parameter)
+    """
+
+    total, seconds_under_load = 0, 0
+
+    for energy in energies:
+        under_load = energy.sel(parameter="power load") != 0
+        total = total + xr.concat(
+            [
+                energy.sel(parameter=ENERGY_SUMS),
+                energy.sel(parameter=ENERGY_MEANS).where(under_load, 0),
+            ],
+            dim="parameter",
+        ).sum(dim="second")
+        seconds_under_load = seconds_under_load + under_load.sum(dim="second")
+
+    total.loc[dict(parameter=ENERGY_MEANS)] = total.sel(
+        parameter=ENERGY_MEANS
+    ) / seconds_under_load.where(seconds_under_load > 0, 1)
+
+    return total.expand_dims("second")
+
+
+class EnergyProfile:
+    """
+    Outputs of the energy consumption model for each second of the driving cycle,
+    read by the emission methods of :class:`carculator_utils.model.VehicleModel`
+    through `energy` (see :meth:`TruckModel.per_second_energy`), without being stored
+    for each parameter: the velocity, which only depends on the size of the vehicles,
+    is broadcast from the energy consumption model, and the motive, auxiliary and
+    recuperated energy are stored as their sum, as read by the emission methods.
+
+    :ivar velocity: velocity, in m/s, broadcast to the dimensions of `consumption`
+    :vartype velocity: xarray.DataArray
+    :ivar consumption: energy consumption, in kJ, with dimensions
+        (second, value, year, powertrain, size)
+    :vartype consumption: xarray.DataArray
+    """
+
+    def __init__(self, velocity: np.ndarray, consumption: xr.DataArray) -> None:
+        """
+        :param velocity: velocity of the energy consumption model, which broadcasts
+            against `consumption`
+        :param consumption: energy consumption (see `ENERGY_CONSUMPTION`)
+        """
+
+        self.consumption = consumption
+        self.velocity = xr.DataArray(
+            np.broadcast_to(velocity, consumption.shape),
+            coords=consumption.coords,
+            dims=consumption.dims,
+        )
+
+    def sel(self, parameter, **indexers) -> xr.DataArray:
+        """
+        Select the velocity, or the outputs summed into the energy consumption,
+        along a `parameter` dimension of length 1.
+
+        :param parameter: "velocity", or the names in `ENERGY_CONSUMPTION`
+        :param indexers: labels of the other dimensions
+        :return: selected values
+        """
+
+        if isinstance(parameter, str) and parameter == "velocity":
+            return self.velocity.sel(**indexers)
+
+        if sorted(parameter) == sorted(ENERGY_CONSUMPTION):
+            return (
+                self.consumption.sel(**indexers)
+                .expand_dims(parameter=["energy consumption"])
+                .transpose(..., "parameter")
+            )
+
+        raise KeyError(f"{parameter} is not kept for each second of the cycle.")
+
+
 class TruckModel(VehicleModel):
     """
     This class represents the entirety of the vehicles considered, with useful attributes, such as an array that stores
@@ -34,10 +706,147 @@ class TruckModel(VehicleModel):
     :vartype mappings: dict
     :ivar ecm: instance of :class:`EnergyConsumptionModel` class for a given driving cycle
     :vartype ecm: coarse.energy_consumption.EnergyConsumptionModel
+    :ivar energy: outputs of the energy consumption model, for each second of the driving cycle
+        if `keep_energy` is True, otherwise summed over the driving cycle
+    :vartype energy: xarray.DataArray
+    :ivar energy_profile: if `keep_energy` is False, energy consumption (sum of motive,
+        auxiliary and recuperated energy) of each vehicle, for each second of the driving
+        cycle, needed to calculate emissions (see :meth:`per_second_energy`).
+        Not kept for vehicles sized by chunks of iterations.
+    :vartype energy_profile: xarray.DataArray
+    :ivar seed: seed of the random draws made while sizing the vehicles
+    :vartype seed: int
+    :ivar stochastic: True if the cost factors of energy storage are drawn at random
+        (see :meth:`adjust_cost`): the model was created with more than one iteration,
+        none of which is labelled `reference` (as in a sensitivity analysis).
+        Decided once, and shared by the chunks of iterations of the model.
+    :vartype stochastic: bool
+    :ivar value_positions: position of each iteration of :attr:`array`, in the array
+        of the model it was taken from (see :meth:`get_chunk`), or None for a model
+        holding all its iterations
+    :vartype value_positions: numpy.ndarray
+    :ivar cycles: names of the driving cycles, if several were given as `cycle`.
+        Results are then stored along a `cycle` dimension of :attr:`array`.
+    :vartype cycles: list
+    :ivar shared_steps: names of the steps of :meth:`set_all` already run on the array
+        shared by several driving cycles, and skipped when sizing the vehicles
+        for each driving cycle (see :meth:`set_all_by_cycles`)
+    :vartype shared_steps: set
+    :ivar cargo_masses_file: path to the file of generic payloads and annual mileages
+    :vartype cargo_masses_file: pathlib.Path
+    :ivar view: NumPy access to :attr:`array` by label, used by the calculations
+        run in the sizing loop (see :class:`carculator_truck.array_view.ArrayView`)
+    :vartype view: ArrayView
+    :ivar changed: names of the parameters assigned since the vehicles were last calculated,
+        taken into account by :meth:`recompute`
+    :vartype changed: set
+    :ivar hybrids: plugin hybrids and their electric and combustion modes,
+        as calculated before the modes were dropped
+    :vartype hybrids: xarray.DataArray
 
     """
 
-    def set_all(self, electric_utility_factor: float = None):
+    def __init__(
+        self,
+        *args,
+        keep_energy: bool = False,
+        energy_chunk_size: int = 600,
+        seed: int = None,
+        cargo_masses_file: Path = CARGO_MASSES,
+        **kwargs,
+    ) -> None:
+        """
+        See :class:`carculator_utils.model.VehicleModel` for other arguments.
+
+        :param keep_energy: if True, all outputs of the energy consumption model are stored
+            for each second of the driving cycle in :attr:`energy`.
+            Otherwise, the energy consumption model is run over chunks of the driving cycle
+            and only the values needed to size the vehicles are kept.
+        :param energy_chunk_size: number of seconds of the driving cycle per chunk
+        :param seed: seed of the random draws made while sizing the vehicles
+            (e.g., cost factors of energy storage), for reproducible results.
+            If not given, a random seed is drawn, which is shared by all
+            chunks of iterations of the model (see :meth:`get_random_generators`).
+        :param cargo_masses_file: path to a file of payloads and annual mileages,
+            formatted as `data/payloads.yaml`, used where `payload` or `annual_mileage`
+            are not given. Files are loaded once per process (see :func:`load_cargo_masses`).
+
+        `cycle` can also be a list of names of driving cycles, in which case the vehicles
+        are sized for each driving cycle (see :meth:`set_all_by_cycles`).
+        """
+
+        # given as dictionaries, or as pandas objects (see :func:`align_to_coordinates`)
+        payload = kwargs.pop("payload", None)
+        annual_mileage = kwargs.pop("annual_mileage", None)
+
+        # parameters assigned since the vehicles were last calculated
+        self.changed = set()
+
+        super().__init__(*args, **kwargs)
+
+        self.payload = payload if payload is not None else {}
+        self.annual_mileage = annual_mileage if annual_mileage is not None else {}
+        self.cargo_masses_file = Path(cargo_masses_file)
+
+        self.array_index = None
+        self.utility_factor = None
+        self.hybrids = None
+        self.ttw_energy = None
+
+        self.cycles = None
+        if isinstance(self.cycle, list) and all(isinstance(c, str) for c in self.cycle):
+            if self.gradient is not None:
+                raise ValueError(
+                    "A gradient cannot be given for several driving cycles."
+                )
+            self.cycles, self.cycle = self.cycle, self.cycle[0]
+
+        # energy consumption overrides are given per second of the driving cycle
+        self.keep_energy = keep_energy or bool(self.energy_consumption)
+        self.energy_chunk_size = energy_chunk_size
+        self.energy_profile = None
+        self.sizing_iterations = None
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.stochastic = (
+            self.array.sizes["value"] > 1
+            and "reference" not in self.array.coords["value"].values.tolist()
+        )
+        self.value_positions = None
+        self.shared_steps = set()
+
+    @property
+    def index(self) -> ArrayIndex:
+        """
+        Index of the labels of :attr:`array`, built again when the array is replaced.
+        """
+
+        if self.array_index is None or self.array_index.array is not self.array:
+            self.array_index = ArrayIndex(self.array)
+
+        return self.array_index
+
+    @property
+    def view(self) -> ArrayView:
+        """
+        NumPy access to :attr:`array` by label.
+        """
+        return ArrayView(self.index)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+
+        # recalculated by `recompute`
+        self.changed.update([key] if isinstance(key, str) else key)
+
+    def set_all(
+        self,
+        electric_utility_factor: float = None,
+        solver: str = "fixed-point",
+        tolerance: float = 0.01,
+        max_iterations: int = 25,
+        chunk_size: int = None,
+        n_workers: int = None,
+    ):
         """
         This method runs a series of other methods to obtain the tank-to-wheel energy requirement,
         efficiency of the vehicle, costs, etc.
@@ -49,126 +858,731 @@ class TruckModel(VehicleModel):
         by the `target range` the truck has. `power` is also varying with `curb_mass`.
 
         The current solution is to loop through the methods until the change in payload between
-        two iterations is inferior to 0.1%. It is then assumed that the trucks are correctly sized.
+        two iterations is inferior to `tolerance` for each vehicle. Vehicles that have converged are frozen
+        and are no longer recomputed (see :meth:`size_vehicles`).
+        It is then assumed that the trucks are correctly sized.
+        The number of iterations needed by each vehicle is stored in :attr:`sizing_iterations`.
+
+        With the "fixed-point" solver, the curb mass obtained at the end of an iteration
+        is used as the starting point of the next one. With the "secant" solver, the starting
+        point is instead extrapolated from the two previous iterations, which reduces the number
+        of iterations needed by vehicles whose mass converges slowly (e.g., long-range BEV tractors).
 
         :param electric_utility_factor: the share of km driven in battery-depleting mode over the required range autonomy
+        :param solver: "fixed-point" or "secant"
+        :param tolerance: relative change in available payload below which a vehicle is considered sized
+        :param max_iterations: maximum number of sizing iterations
+        :param chunk_size: if given, the iterations of the `value` dimension are processed
+            by chunks of `chunk_size` iterations, to limit memory use (see :meth:`set_all_by_chunks`)
+        :param n_workers: if greater than 1, chunks of iterations are processed in parallel
+            by as many processes. If `chunk_size` is not given, the iterations are split
+            evenly between processes.
         :return: Does not return anything. Modifies ``self.array`` in place.
         """
 
-        diff = 1.0
+        if solver not in SIZING_SOLVERS:
+            raise ValueError(
+                f"Unknown solver {solver}. Valid solvers are: {', '.join(SIZING_SOLVERS)}."
+            )
+
+        if self.cycles:
+            with stage("set_all", self.array):
+                self.set_all_by_cycles(
+                    electric_utility_factor=electric_utility_factor,
+                    solver=solver,
+                    tolerance=tolerance,
+                    max_iterations=max_iterations,
+                    chunk_size=chunk_size,
+                    n_workers=n_workers,
+                )
+            self.changed.clear()
+            return
+
+        if n_workers and n_workers > 1 and not chunk_size:
+            chunk_size = -(-self.array.sizes["value"] // n_workers)
+
+        with stage("set_all", self.array):
+            if chunk_size and self.array.sizes["value"] > chunk_size:
+                self.set_all_by_chunks(
+                    chunk_size,
+                    n_workers=n_workers,
+                    electric_utility_factor=electric_utility_factor,
+                    solver=solver,
+                    tolerance=tolerance,
+                    max_iterations=max_iterations,
+                )
+            else:
+                self.calculate_vehicles(
+                    electric_utility_factor=electric_utility_factor,
+                    solver=solver,
+                    tolerance=tolerance,
+                    max_iterations=max_iterations,
+                )
+
+            self.display_payloads()
+
+        self.changed.clear()
+
+    def calculate_vehicles(
+        self,
+        electric_utility_factor: float = None,
+        solver: str = "fixed-point",
+        tolerance: float = 0.01,
+        max_iterations: int = 25,
+    ):
+        """
+        Size the vehicles and calculate their properties, for all
+        iterations of the `value` dimension at once.
+        See :meth:`set_all` for a description of the arguments.
+        """
 
         self["is_compliant"] = True
         self["is_available"] = True
 
-        self.set_cargo_mass_and_annual_mileage()
+        with stage("set_cargo_mass_and_annual_mileage", self.array):
+            self.set_cargo_mass_and_annual_mileage()
+
+        with stage("get_energy_consumption_model", self.array):
+            self.ecm = self.get_energy_consumption_model(
+                self.array.coords["size"].values.tolist(),
+                self.array.coords["powertrain"].values.tolist(),
+            )
+
+        print("Finding solutions for trucks...")
+        with stage("override_range", self.array):
+            self.override_range()
+
+        if not self.target_mass:
+            with stage("set_vehicle_masses", self.array):
+                self.set_vehicle_masses()
+
+        self.size_until_converged(solver, tolerance, max_iterations)
+
+        self["cargo mass"] = np.clip(self["cargo mass"], 0, self["available payload"])
+
+        self["capacity utilization"] = np.clip(
+            (self["cargo mass"] / self["available payload"]), 0, 1
+        )
+
+        self.run_steps(
+            [s for s in CYCLE_INDEPENDENT_STEPS if s not in self.shared_steps]
+        )
+
+        self.utility_factor = electric_utility_factor
+        self.run_steps(self.get_post_sizing_steps())
+
+    def size_until_converged(
+        self,
+        solver: str = "fixed-point",
+        tolerance: float = 0.01,
+        max_iterations: int = 25,
+    ):
+        """
+        Run sizing iterations until the available payload of each vehicle has converged.
+        See :meth:`set_all` for a description of the arguments.
+        """
+
+        # Convergence is tracked for each (size, powertrain, year, value) cell.
+        # Once the available payload of a cell has settled, the cell is frozen
+        # and subsequent iterations only recompute the cells still moving.
+        converged = np.zeros(self["available payload"].shape, dtype=bool)
+        iterations = np.zeros(converged.shape, dtype=int)
+        previous = None
+
+        while not converged.all():
+            if iterations.max() == max_iterations:
+                warnings.warn(
+                    f"{(~converged).sum()} vehicle(s) did not converge "
+                    f"after {max_iterations} sizing iterations."
+                )
+                break
+
+            iterations += ~converged
+            start = self["curb mass"].values.astype(float)
+            old_payload = self["available payload"].values.copy()
+
+            with stage(f"sizing iteration {iterations.max()}", self.array):
+                self.size_vehicles(~converged)
+
+            end = self["curb mass"].values.astype(float)
+            new_payload = self["available payload"].values
+            converged |= ~(
+                np.abs(new_payload - old_payload) > tolerance * np.abs(new_payload)
+            )
+
+            # a curb mass imposed by the user cannot be extrapolated
+            if solver == "secant" and not self.target_mass:
+                residual = end - start
+                if previous is not None:
+                    self.set_curb_mass(
+                        np.where(
+                            converged,
+                            end,
+                            secant_update(start, residual, *previous, fallback=end),
+                        )
+                    )
+                previous = (start, residual)
+
+        self.sizing_iterations = xr.DataArray(
+            iterations,
+            coords=self["available payload"].coords,
+            dims=self["available payload"].dims,
+        )
+
+    def get_post_sizing_steps(self) -> list:
+        """
+        Return the names of the steps run once the vehicles are sized, in order
+        (see `POST_SIZING_STEPS`).
+
+        :return: list of method names
+        """
+
+        return [
+            name
+            for name in POST_SIZING_STEPS
+            if name != "drop_hybrid" or self.drop_hybrids
+        ]
+
+    def run_steps(self, names: list):
+        """
+        Run the methods `names`, in order.
+
+        :param names: list of method names
+        """
+
+        arguments = {"set_electric_utility_factor": (self.utility_factor,)}
+
+        for name in names:
+            with stage(name, self.array):
+                getattr(self, name)(*arguments.get(name, ()))
+
+    def recompute(self, parameters: list = None) -> list:
+        """
+        Once the vehicles are sized, update the parameters that depend on
+        changed parameters, by running again only the steps that read them,
+        directly or through the outputs of other steps (see `STEP_PARAMETERS`),
+        in the order of :meth:`set_all`. For example::
+
+            tm.set_all()
+            tm["interest rate"] = 0.05
+            tm.recompute()  # only runs set_costs, and the steps that follow it
+
+        Parameters assigned with ``tm[parameter] = value`` are tracked in :attr:`changed`.
+        Parameters changed otherwise (e.g., through :attr:`array`) must be given as `parameters`.
+
+        Parameters that the sizing of the vehicles depends on (see `SIZING_INPUTS`)
+        cannot be changed this way: vehicles must then be sized again, with a new model.
+
+        :param parameters: names of changed parameters, in addition to :attr:`changed`
+        :return: names of the steps run
+        :raises ValueError: if the vehicles are not sized yet,
+            or if a changed parameter affects their sizing, or their emissions
+            while the energy consumption of each second was not kept
+            (see :meth:`set_all_by_chunks`)
+        """
+
+        if self.sizing_iterations is None:
+            raise ValueError("Vehicles must be sized first, with set_all().")
+
+        if self.cycles:
+            raise ValueError(
+                "Vehicles sized for several driving cycles cannot be recomputed."
+            )
+
+        changed = self.changed | set(parameters or [])
+
+        sizing = sorted(changed & SIZING_INPUTS)
+        if sizing:
+            raise ValueError(
+                f"The sizing of the vehicles depends on {', '.join(sizing)}: "
+                "run set_all() on a new model instead."
+            )
+
+        steps = get_affected_steps(self.get_post_sizing_steps(), changed)
+
+        per_second = [step for step in steps if step in PER_SECOND_STEPS]
+        if per_second and not self.keep_energy and self.energy_profile is None:
+            raise ValueError(
+                f"{', '.join(per_second)} cannot be run again, as the energy "
+                "consumption of each second of the driving cycle is not kept "
+                "for vehicles sized by chunks: run set_all() on a new model instead."
+            )
+
+        if steps:
+            self.restore_post_sizing_values(changed)
+            self.run_steps(steps)
+
+        self.changed.clear()
+
+        return steps
+
+    def restore_post_sizing_values(self, changed: set):
+        """
+        Restore the values that the last steps of :meth:`set_all` overwrite,
+        before running steps again in :meth:`recompute`: the energy consumption
+        of unavailable vehicles, set to zero, and the electric and combustion
+        modes of plugin hybrids, if they were dropped.
+
+        Where a changed parameter of a plugin hybrid differs from the value it had
+        once calculated from its modes, both modes are given the new value,
+        as if it had been given before the vehicles were sized.
+
+        :param changed: names of the changed parameters
+        """
+
+        if self.ttw_energy is not None:
+            self.array.loc[
+                dict(
+                    parameter="TtW energy",
+                    powertrain=self.ttw_energy.coords["powertrain"].values,
+                )
+            ] = self.ttw_energy.values
+
+        if self.hybrids is None:
+            return
+
+        stored = self.hybrids.coords["powertrain"].values.tolist()
+        modes = [pt for pt in stored if pt in ["PHEV-e", "PHEV-c-p", "PHEV-c-d"]]
+        parameters = [p for p in self.array.coords["parameter"].values if p in changed]
+
+        for pwt, pwtc in (("PHEV-d", "PHEV-c-d"), ("PHEV-p", "PHEV-c-p")):
+            if pwt not in stored or pwtc not in modes:
+                continue
+
+            for parameter in parameters:
+                value = self.array.loc[:, pwt, parameter]
+                modified = ~np.isclose(
+                    value, self.hybrids.loc[:, pwt, parameter], equal_nan=True
+                )
+                self.hybrids.loc[:, ["PHEV-e", pwtc], parameter] = np.where(
+                    modified[:, None],
+                    value.values[:, None],
+                    self.hybrids.loc[:, ["PHEV-e", pwtc], parameter].values,
+                )
+
+        self.array = xr.concat(
+            [self.array, self.hybrids.sel(powertrain=modes)], dim="powertrain"
+        )
+
+    def get_chunk(self, values) -> "TruckModel":
+        """
+        Return a shallow copy of the model, restricted to
+        the iterations `values` of the `value` dimension.
+
+        :param values: slice or indices of the `value` dimension
+        :return: :class:`TruckModel` object
+        """
+
+        chunk = copy.copy(self)
+        chunk.array = self.array.isel(value=values).copy()
+        chunk.changed = set()
+        chunk.value_positions = self.get_value_positions()[values]
+
+        for attr in RESULT_ATTRIBUTES:
+            if getattr(self, attr) is not None:
+                setattr(chunk, attr, getattr(self, attr).isel(value=values).copy())
+
+        return chunk
+
+    def set_all_by_chunks(self, chunk_size: int, n_workers: int = None, **kwargs):
+        """
+        Run :meth:`calculate_vehicles` on consecutive chunks of `chunk_size`
+        iterations of the `value` dimension, and concatenate the results.
+        Iterations being independent from one another, the results are
+        the same as when all iterations are processed at once, but the
+        memory used by the energy consumption model and the sizing loop
+        is bound by `chunk_size`. The energy consumption of each second of the
+        driving cycle is not kept (see :func:`calculate_chunk`), so that emissions
+        cannot be calculated again by :meth:`recompute`, unless `keep_energy` is True.
+
+        Random numbers are drawn from a stream specific to each iteration
+        (see :meth:`get_random_generators`), so that the results do not depend
+        on the chunk size, nor on the number of workers.
+
+        :param chunk_size: number of iterations per chunk
+        :param n_workers: if greater than 1, number of processes the chunks are distributed to
+        :param kwargs: arguments passed to :meth:`calculate_vehicles`
+        """
+
+        starts = range(0, self.array.sizes["value"], chunk_size)
+        chunks = (self.get_chunk(slice(start, start + chunk_size)) for start in starts)
+
+        if n_workers and n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                chunks = list(executor.map(calculate_chunk, chunks, repeat(kwargs)))
+        else:
+            chunks = [calculate_chunk(chunk, kwargs) for chunk in chunks]
+
+        values = self.array.coords["value"].values
+        self.array = xr.concat([c.array for c in chunks], dim="value")
+        self.ecm = chunks[-1].ecm
+
+        for attr in RESULT_ATTRIBUTES:
+            if getattr(chunks[-1], attr) is None:
+                setattr(self, attr, None)
+            else:
+                setattr(
+                    self,
+                    attr,
+                    xr.concat(
+                        [getattr(c, attr) for c in chunks], dim="value"
+                    ).assign_coords(value=values),
+                )
+
+    def get_cycle(self, cycle: str) -> "TruckModel":
+        """
+        Return a shallow copy of the model, for the driving cycle `cycle`.
+        If the vehicles were sized for several driving cycles, the copy
+        holds the results of `cycle`, e.g., to be passed to :class:`InventoryTruck`.
+
+        :param cycle: name of the driving cycle
+        :return: :class:`TruckModel` object
+        """
+
+        model = copy.copy(self)
+        model.cycle, model.cycles = cycle, None
+        model.changed = set()
+
+        if "cycle" not in self.array.dims:
+            model.array = self.array.copy()
+            return model
+
+        model.array = self.array.sel(cycle=cycle, drop=True)
+
+        for attr in RESULT_ATTRIBUTES:
+            if getattr(self, attr) is not None:
+                values = getattr(self, attr).sel(cycle=cycle, drop=True)
+                # driving cycles of different lengths are padded with NaN
+                if "second" in values.dims:
+                    values = values.dropna(dim="second", how="all")
+                setattr(model, attr, values)
+
+        # the velocity of the driving cycle is read from the energy consumption model
+        model.ecm = model.get_energy_consumption_model(
+            model.array.coords["size"].values.tolist(),
+            model.array.coords["powertrain"].values.tolist(),
+        )
+
+        return model
+
+    def set_all_by_cycles(self, **kwargs):
+        """
+        Size the vehicles for each driving cycle in :attr:`cycles`, and concatenate
+        the results along a `cycle` dimension.
+        All driving cycles start from the same input parameters, and the random draws
+        made while sizing the vehicles are the same for all driving cycles,
+        so that the differences between driving cycles are only due to the cycles.
+        The cargo mass, annual mileage and target range of the vehicles
+        are those of each driving cycle.
+
+        The steps that do not depend on the driving cycle (see `CYCLE_INDEPENDENT_STEPS`,
+        e.g., the costs of energy storage and power components set by :meth:`adjust_cost`)
+        are run once, on the input parameters shared by all driving cycles.
+        The masses of components depend on their power, which is sized for each
+        driving cycle: only the parameters of their mass curves are shared.
+
+        :param kwargs: arguments passed to :meth:`set_all`
+        """
+
+        self.run_steps(CYCLE_INDEPENDENT_STEPS)
+
+        models = [self.get_cycle(cycle) for cycle in self.cycles]
+        for model in models:
+            model.shared_steps = set(CYCLE_INDEPENDENT_STEPS)
+            model.set_all(**kwargs)
+
+        self.array = xr.concat([m.array for m in models], dim="cycle").assign_coords(
+            cycle=self.cycles
+        )
+        self.ecm = models[-1].ecm
+
+        for attr in RESULT_ATTRIBUTES:
+            if getattr(models[-1], attr) is None:
+                setattr(self, attr, None)
+            else:
+                setattr(
+                    self,
+                    attr,
+                    xr.concat(
+                        [getattr(m, attr) for m in models], dim="cycle"
+                    ).assign_coords(cycle=self.cycles),
+                )
+
+    def get_value_positions(self) -> np.ndarray:
+        """
+        Return the position of each iteration of the `value` dimension
+        in the full array of the model, chunks included (see :meth:`get_chunk`).
+
+        :return: array of positions
+        """
+
+        if self.value_positions is None:
+            return np.arange(self.array.sizes["value"])
+
+        return self.value_positions
+
+    def get_random_generators(self) -> list:
+        """
+        Return a random number generator for each iteration of the `value` dimension.
+        Generators are based on the counter-based Philox bit generator, keyed by
+        :attr:`seed`. The stream of an iteration starts at a counter offset given by
+        the position of the iteration in the full array of the model
+        (see :meth:`get_value_positions`), so that the draws of any chunk
+        of iterations are the same as when all iterations are processed at once.
+
+        :return: list of :class:`numpy.random.Generator` objects
+        """
+
+        return [
+            np.random.Generator(
+                np.random.Philox(self.seed, counter=[0, 0, 0, int(position)])
+            )
+            for position in self.get_value_positions()
+        ]
+
+    def get_energy_consumption_model(
+        self, sizes: list, powertrains: list
+    ) -> EnergyConsumptionModel:
+        """
+        Return an energy consumption model for the given sizes and powertrains,
+        using the driving cycle, gradient and country of the model.
+
+        Models are kept in `ENERGY_CONSUMPTION_MODELS` and shared by all
+        truck models: their arrays are read-only.
+
+        :param sizes: list of vehicle sizes
+        :param powertrains: list of powertrains
+        :return: :class:`EnergyConsumptionModel` object
+        """
+
+        key = (
+            tuple(sizes),
+            tuple(powertrains),
+            cycle_key(self.cycle),
+            cycle_key(self.gradient),
+            self.country,
+        )
+
+        if key in ENERGY_CONSUMPTION_MODELS:
+            # moved to the end, as the most recently used
+            ENERGY_CONSUMPTION_MODELS[key] = ENERGY_CONSUMPTION_MODELS.pop(key)
+            return ENERGY_CONSUMPTION_MODELS[key]
 
-        self.ecm = EnergyConsumptionModel(
+        ecm = EnergyConsumptionModel(
             vehicle_type="truck",
-            vehicle_size=self.array.coords["size"].values.tolist(),
+            vehicle_size=list(sizes),
             cycle=self.cycle,
             gradient=self.gradient,
             country=self.country,
-            powertrains=self.array.coords["powertrain"].values.tolist(),
+            powertrains=list(powertrains),
         )
+        for attr in ["cycle", "gradient", "velocity", "acceleration", "driving_time"]:
+            getattr(ecm, attr).flags.writeable = False
 
-        print("Finding solutions for trucks...")
-        self.override_range()
+        if len(ENERGY_CONSUMPTION_MODELS) >= MAX_ENERGY_CONSUMPTION_MODELS:
+            del ENERGY_CONSUMPTION_MODELS[next(iter(ENERGY_CONSUMPTION_MODELS))]
+        ENERGY_CONSUMPTION_MODELS[key] = ecm
 
-        while abs(diff) > 0.01:
-            old_payload = self["available payload"].sum().values
+        return ecm
 
-            if self.target_mass:
-                self.override_vehicle_mass()
-            else:
-                self.set_vehicle_masses()
+    def set_curb_mass(self, curb_mass: np.ndarray):
+        """
+        Set the curb mass of the vehicles, and update
+        the driving mass and available payload accordingly.
 
-            self.set_power_parameters()
-            self.set_fuel_cell_power()
-            self.set_fuel_cell_mass()
+        :param curb_mass: array of shape (size, powertrain, year, value)
+        """
 
-            self.set_component_masses()
-            self.set_auxiliaries()
-            self.set_recuperation()
-            self.set_battery_preferences()
+        view = self.view
+        passengers_mass = view["average passengers"] * view["average passenger mass"]
 
-            if self.energy_consumption:
-                self.override_ttw_energy()
-            else:
-                self.calculate_ttw_energy()
-            self.set_ttw_efficiency()
+        view["curb mass"] = curb_mass
+        view["driving mass"] = view["curb mass"] + view["cargo mass"] + passengers_mass
+        view["available payload"] = (
+            view["gross mass"] - view["curb mass"] - passengers_mass
+        )
 
-            self.set_share_recuperated_energy()
-            self.set_battery_fuel_cell_replacements()
+    def run_sizing_iteration(self):
+        """
+        Run once the chain of methods that size the vehicles:
+        power, energy consumption and energy storage, starting
+        from the current curb mass. The curb mass is then
+        recalculated from the mass of the components.
+        """
+
+        steps = [self.override_vehicle_mass] if self.target_mass else []
+        steps += [
+            self.set_power_parameters,
+            self.set_fuel_cell_power,
+            self.set_fuel_cell_mass,
+            self.set_component_masses,
+            self.set_auxiliaries,
+            self.set_recuperation,
+            self.set_battery_preferences,
+            (
+                self.override_ttw_energy
+                if self.energy_consumption
+                else self.calculate_ttw_energy
+            ),
+            self.set_ttw_efficiency,
+            self.set_share_recuperated_energy,
+            self.set_energy_stored_properties,
+            self.set_power_battery_properties,
+            self.set_vehicle_masses,
+        ]
 
-            self.set_energy_stored_properties()
-            self.set_power_battery_properties()
-            self.set_vehicle_masses()
+        for step in steps:
+            with stage(step.__name__, self.array):
+                step()
 
-            diff = (self["available payload"].sum().values - old_payload) / self[
-                "available payload"
-            ].sum()
+    def size_vehicles(self, active: np.ndarray):
+        """
+        Run one sizing iteration on the vehicles flagged in `active`.
+        The iteration is run on the smallest block of sizes, powertrains
+        and iterations that contains all active vehicles (all years are kept,
+        as fuel blends are defined for each year of the scope).
+        Within that block, the values of inactive (i.e., converged) vehicles
+        are left untouched, in :attr:`array` as well as in :attr:`energy`.
+
+        User-defined overrides (mass, power, energy consumption) are
+        keyed by powertrain, size and year: in that case, the block
+        spans all vehicles.
+
+        :param active: boolean array of shape (size, powertrain, year, value)
+        """
 
-        self["cargo mass"] = np.clip(self["cargo mass"], 0, self["available payload"])
+        if active.all():
+            self.run_sizing_iteration()
+            return
 
-        self["capacity utilization"] = np.clip(
-            (self["cargo mass"] / self["available payload"]), 0, 1
+        if self.target_mass or self.power or self.energy_consumption:
+            block = [np.arange(n) for n in active.shape]
+        else:
+            block = [
+                np.flatnonzero(
+                    active.any(axis=tuple(a for a in range(active.ndim) if a != d))
+                )
+                for d in range(active.ndim)
+            ]
+            block[2] = np.arange(active.shape[2])
+
+            # plugin hybrids are calculated from one another
+            powertrains = self.array.coords["powertrain"].values.tolist()
+            phevs = [
+                powertrains.index(p)
+                for p in ["PHEV-d", "PHEV-e", "PHEV-c-d"]
+                if p in powertrains
+            ]
+            if any(p in block[1] for p in phevs):
+                block[1] = np.union1d(block[1], phevs)
+
+        sizes, powertrains, years, values = block
+        parameters = np.arange(self.array.sizes["parameter"])
+        mask = active[np.ix_(*block)]
+
+        array, energy, profile, ecm = (
+            self.array,
+            self.energy,
+            self.energy_profile,
+            self.ecm,
         )
 
-        self.adjust_cost()
+        self.array = array.isel(
+            size=sizes, powertrain=powertrains, year=years, value=values
+        )
+        self.ecm = self.get_energy_consumption_model(
+            self.array.coords["size"].values.tolist(),
+            self.array.coords["powertrain"].values.tolist(),
+        )
 
-        self.set_electric_utility_factor(electric_utility_factor)
-        self.set_electricity_consumption()
-        self.set_costs()
-        self.set_particulates_emission()
-        self.set_noise_emissions()
-        self.set_hot_emissions()
-        self.create_PHEV()
-        if self.drop_hybrids:
-            self.drop_hybrid()
+        try:
+            self.run_sizing_iteration()
+        finally:
+            block_array, block_energy, block_profile = (
+                self.array,
+                self.energy,
+                self.energy_profile,
+            )
+            self.array, self.energy, self.energy_profile, self.ecm = (
+                array,
+                energy,
+                profile,
+                ecm,
+            )
 
-        self.remove_energy_consumption_from_unavailable_vehicles()
+        idx = np.ix_(sizes, powertrains, parameters, years, values)
+        self.array.values[idx] = np.where(
+            mask[:, :, None, :, :], block_array.values, self.array.values[idx]
+        )
+
+        # `energy` and `energy_profile` have dimensions
+        # (second, value, year, powertrain, size[, parameter])
+        mask = mask.transpose(3, 2, 1, 0)[None, ...]
+        for full, part in [
+            (self.energy, block_energy),
+            (self.energy_profile, block_profile),
+        ]:
+            if full is None:
+                continue
+            idx = np.ix_(
+                np.arange(full.sizes["second"]),
+                values,
+                years,
+                powertrains,
+                sizes,
+                *[np.arange(n) for n in full.shape[5:]],
+            )
+            full.values[idx] = np.where(
+                mask.reshape(mask.shape + (1,) * (full.ndim - 5)),
+                part.values,
+                full.values[idx],
+            )
 
     def set_cargo_mass_and_annual_mileage(self):
-        """Set the cargo mass and annual mileage of the vehicles."""
-
-        if self.payload:
-            for s in self.array.coords["size"].values:
-                for p in self.array.coords["powertrain"].values:
-                    for y in self.array.coords["year"].values:
-                        self.array.loc[
-                            dict(size=s, powertrain=p, year=y, parameter="cargo mass")
-                        ] = self.payload[(p, s, y)]
+        """
+        Set the cargo mass and annual mileage of the vehicles.
+        Values given for each (powertrain, size, year) combination
+        are aligned to the coordinates of the array and assigned at once.
+        """
+
+        parameters = self.array.get_index("parameter")
+
+        if len(self.payload) > 0:
+            self.array.values[:, :, parameters.get_loc("cargo mass")] = (
+                align_to_coordinates(self.payload, self.array)[..., None]
+            )
         else:
-            with open(CARGO_MASSES, "r", encoding="utf-8") as stream:
-                generic_payload = yaml.safe_load(stream)["payload"]
-
-            for s in self.array.coords["size"].values:
-                cycle = self.cycle if isinstance(self.cycle, str) else "Urban delivery"
-                self.array.loc[dict(size=s, parameter="cargo mass")] = generic_payload[
-                    cycle
-                ][s]
-
-        if self.annual_mileage:
-            for s in self.array.coords["size"].values:
-                for p in self.array.coords["powertrain"].values:
-                    for y in self.array.coords["year"].values:
-                        self.array.loc[
-                            dict(
-                                size=s,
-                                powertrain=p,
-                                year=y,
-                                parameter="kilometers per year",
-                            )
-                        ] = self.annual_mileage[(p, s, y)]
+            self.array.loc[dict(parameter="cargo mass")] = self.get_generic_values(
+                "payload"
+            )
+
+        if len(self.annual_mileage) > 0:
+            self.array.values[:, :, parameters.get_loc("kilometers per year")] = (
+                align_to_coordinates(self.annual_mileage, self.array)[..., None]
+            )
         else:
-            with open(CARGO_MASSES, "r", encoding="utf-8") as stream:
-                annual_mileage = yaml.safe_load(stream)["annual mileage"]
+            self.array.loc[dict(parameter="kilometers per year")] = (
+                self.get_generic_values("annual mileage")
+            )
 
-            for s in self.array.coords["size"].values:
-                cycle = self.cycle if isinstance(self.cycle, str) else "Urban delivery"
-                self.array.loc[dict(size=s, parameter="kilometers per year")] = (
-                    annual_mileage[cycle][s]
-                )
+    def get_generic_values(self, table: str) -> xr.DataArray:
+        """
+        Return the generic values of a table of :attr:`cargo_masses_file`
+        (e.g., `payload` or `annual mileage`) for the driving cycle
+        and each size of the model.
+
+        :param table: name of the table
+        :return: array of values, along the `size` dimension
+        """
+
+        values = load_cargo_masses(self.cargo_masses_file.resolve())[table]
+        cycle = self.cycle if isinstance(self.cycle, str) else "Urban delivery"
+
+        return xr.DataArray(
+            [values[cycle][s] for s in self.array.coords["size"].values],
+            coords={"size": self.array.coords["size"]},
+            dims="size",
+        )
 
     def adjust_cost(self):
         """
@@ -179,35 +1593,42 @@ class TruckModel(VehicleModel):
         n_iterations = self.array.shape[-1]
         n_year = len(self.array.year.values)
 
-        # If uncertainty is not considered, teh cost factor equals 1.
-        # Otherwise, a variability of +/-30% is added.
+        # If uncertainty is not considered (static runs, or sensitivity analyses),
+        # teh cost factor equals 1. Otherwise, a variability of +/-30% is added.
+        # Chunks of a run follow the run (see `stochastic`).
+        # Parameters are selected by label, as the array of vehicles sized for
+        # several driving cycles has a `cycle` dimension (see `set_all_by_cycles`).
 
-        if n_iterations == 1:
-            cost_factor = 1
+        if not self.stochastic:
+            cost_factor = np.ones((n_iterations, 1))
 
             # reflect a scaling effect for fuel cells
             # according to
             # FCEV trucks should cost the triple of an ICEV-d in 2020
-            cost_factor_fcev = 5
+            cost_factor_fcev = np.full((n_iterations, 1), 5)
 
         else:
-            if "reference" in self.array.value.values.tolist():
-                cost_factor = np.ones((n_iterations, 1))
-                cost_factor_fcev = np.full((n_iterations, 1), 5)
-            else:
-                cost_factor = np.random.triangular(0.7, 1, 1.3, (n_iterations, 1))
-                cost_factor_fcev = np.random.triangular(3, 5, 6, (n_iterations, 1))
+            cost_factor, cost_factor_fcev = np.array(
+                [
+                    [rng.triangular(0.7, 1, 1.3), rng.triangular(3, 5, 6)]
+                    for rng in self.get_random_generators()
+                ]
+            ).T[..., None]
 
         # Correction of hydrogen tank cost, per kg
         if "FCEV" in self.array.powertrain.values.tolist():
-            self.array.loc[:, ["FCEV"], "fuel tank cost per kg", :, :] = np.reshape(
+            self.array.loc[
+                dict(powertrain=["FCEV"], parameter="fuel tank cost per kg")
+            ] = np.reshape(
                 (1.078e58 * np.exp(-6.32e-2 * self.array.year.values) + 3.43e2)
                 * cost_factor_fcev,
                 (1, 1, n_year, n_iterations),
             )
 
             # Correction of fuel cell stack cost, per kW
-            self.array.loc[:, ["FCEV"], "fuel cell cost per kW", :, :] = np.reshape(
+            self.array.loc[
+                dict(powertrain=["FCEV"], parameter="fuel cell cost per kW")
+            ] = np.reshape(
                 (3.15e66 * np.exp(-7.35e-2 * self.array.year.values) + 2.39e1)
                 * cost_factor_fcev,
                 (1, 1, n_year, n_iterations),
@@ -221,7 +1642,9 @@ class TruckModel(VehicleModel):
         ]
 
         if len(l_pwt) > 0:
-            self.array.loc[:, l_pwt, "energy battery cost per kWh", :, :] = np.reshape(
+            self.array.loc[
+                dict(powertrain=l_pwt, parameter="energy battery cost per kWh")
+            ] = np.reshape(
                 (2.75e86 * np.exp(-9.61e-2 * self.array.year.values) + 5.059e1)
                 * cost_factor,
                 (1, 1, n_year, n_iterations),
@@ -235,7 +1658,9 @@ class TruckModel(VehicleModel):
         ]
 
         if len(l_pwt) > 0:
-            self.array.loc[:, l_pwt, "power battery cost per kW", :, :] = np.reshape(
+            self.array.loc[
+                dict(powertrain=l_pwt, parameter="power battery cost per kW")
+            ] = np.reshape(
                 (8.337e40 * np.exp(-4.49e-2 * self.array.year.values) + 11.17)
                 * cost_factor,
                 (1, 1, n_year, n_iterations),
@@ -244,11 +1669,9 @@ class TruckModel(VehicleModel):
         # Correction of combustion powertrain cost for ICEV-g
         if "ICEV-g" in self.array.powertrain.values:
             self.array.loc[
-                :,
-                ["ICEV-g"],
-                "combustion powertrain cost per kW",
-                :,
-                :,
+                dict(
+                    powertrain=["ICEV-g"], parameter="combustion powertrain cost per kW"
+                )
             ] = np.reshape(
                 (5.92e160 * np.exp(-0.1819 * self.array.year.values) + 26.76)
                 * cost_factor,
@@ -326,15 +1749,16 @@ class TruckModel(VehicleModel):
 
         print("")
 
-    def calculate_ttw_energy(self):
+    def get_motive_energy(self, ecm: EnergyConsumptionModel) -> xr.DataArray:
         """
-        This method calculates the energy required to operate
-        auxiliary services as well as to move the vehicle.
-        The sum is stored under the parameter label "TtW energy"
-        in :attr:`self.array`.
+        Run the energy consumption model `ecm` with the current
+        vehicle parameters.
+
+        :param ecm: :class:`EnergyConsumptionModel` object
+        :return: energy model outputs, for each second of the driving cycle of `ecm`
         """
 
-        self.energy = self.ecm.motive_energy_per_km(
+        energy = ecm.motive_energy_per_km(
             driving_mass=self["driving mass"],
             rr_coef=self["rolling resistance coefficient"],
             drag_coef=self["aerodynamic drag coefficient"],
@@ -348,24 +1772,18 @@ class TruckModel(VehicleModel):
             fuel_cell_system_efficiency=self["fuel cell system efficiency"],
         )
 
-        self.energy = self.energy.assign_coords(
+        energy = energy.assign_coords(
             {
+                "value": self.array.coords["value"],
                 "powertrain": self.array.powertrain,
                 "year": self.array.year,
                 "size": self.array.coords["size"],
             }
         )
 
-        if self.energy_consumption:
-            self.override_ttw_energy()
-
-        distance = self.energy.sel(parameter="velocity").sum(dim="second") / 1000
-
         # Correction for CNG trucks
         if "ICEV-g" in self.array.powertrain.values:
-            self.energy.loc[
-                dict(parameter="engine efficiency", powertrain="ICEV-g")
-            ] *= (
+            energy.loc[dict(parameter="engine efficiency", powertrain="ICEV-g")] *= (
                 1
                 - self.array.sel(
                     parameter="CNG engine efficiency correction factor",
@@ -373,26 +1791,58 @@ class TruckModel(VehicleModel):
                 )
             ).T.values
 
-        self["transmission efficiency"] = (
-            np.ma.array(
-                self.energy.loc[dict(parameter="transmission efficiency")],
-                mask=self.energy.loc[dict(parameter="power load")] == 0.0,
+        return energy
+
+    def calculate_ttw_energy(self):
+        """
+        This method calculates the energy required to operate
+        auxiliary services as well as to move the vehicle.
+        The sum is stored under the parameter label "TtW energy"
+        in :attr:`self.array`.
+
+        Unless :attr:`keep_energy` is True, the energy consumption model
+        is run over chunks of :attr:`energy_chunk_size` seconds of the
+        driving cycle, and :attr:`energy` only stores sums over the driving cycle.
+        """
+
+        if self.keep_energy:
+            self.energy = self.get_motive_energy(self.ecm)
+
+            if self.energy_consumption:
+                self.override_ttw_energy()
+
+            energy = reduce_motive_energy([self.energy])
+            self.energy_profile = None
+        else:
+            # the energy consumption model is run over chunks of the driving
+            # cycle, and only sums over the driving cycle are kept, along
+            # with the energy consumption needed for emissions
+            profile = []
+
+            def chunks():
+                for ecm in split_driving_cycle(self.ecm, self.energy_chunk_size):
+                    chunk = self.get_motive_energy(ecm)
+                    profile.append(
+                        chunk.sel(parameter=ENERGY_CONSUMPTION).sum(dim="parameter")
+                    )
+                    yield chunk
+
+            self.energy = energy = reduce_motive_energy(chunks())
+            self.energy_profile = xr.concat(profile, dim="second").assign_coords(
+                second=np.arange(self.ecm.velocity.shape[0])
             )
-            .mean(axis=0)
-            .T
-        )
 
+        distance = energy.sel(parameter="velocity").sum(dim="second") / 1000
+
+        self["transmission efficiency"] = (
+            energy.sel(parameter="transmission efficiency").sum(dim="second").values.T
+        )
         self["engine efficiency"] = (
-            np.ma.array(
-                self.energy.loc[dict(parameter="engine efficiency")],
-                mask=self.energy.loc[dict(parameter="power load")] == 0.0,
-            )
-            .mean(axis=0)
-            .T
+            energy.sel(parameter="engine efficiency").sum(dim="second").values.T
         )
 
         self["TtW energy"] = (
-            self.energy.sel(
+            energy.sel(
                 parameter=[
                     "motive energy",
                     "auxiliary energy",
@@ -406,10 +1856,7 @@ class TruckModel(VehicleModel):
         # / (engine efficiency * transmission efficiency)
 
         self["TtW energy"] += (
-            (
-                self.energy.sel(parameter="recuperated energy").sum(dim="second")
-                / distance
-            ).T
+            (energy.sel(parameter="recuperated energy").sum(dim="second") / distance).T
             * self.array.sel(parameter="engine efficiency")
             * self.array.sel(parameter="transmission efficiency")
             / (
@@ -431,7 +1878,7 @@ class TruckModel(VehicleModel):
         )
 
         self["auxiliary energy"] = (
-            self.energy.sel(parameter="auxiliary energy").sum(dim="second").values
+            energy.sel(parameter="auxiliary energy").sum(dim="second").values
             / distance.values
         ).T
 
@@ -452,16 +1899,18 @@ class TruckModel(VehicleModel):
 
         _ = lambda array: np.where(array == 0, 1, array)
 
-        self["battery lifetime replacements"] = np.clip(
+        view = self.view
+
+        view["battery lifetime replacements"] = np.clip(
             (
-                (self["lifetime kilometers"] * self["TtW energy"] / 3600)
-                / _(self["electric energy stored"])
-                / _(self["battery cycle life"])
+                (view["lifetime kilometers"] * view["TtW energy"] / 3600)
+                / _(view["electric energy stored"])
+                / _(view["battery cycle life"])
                 - 1
             ),
             1,
             3,
-        ) * (self["charger mass"] > 0)
+        ) * (view["charger mass"] > 0)
 
         # The number of fuel cell replacements is based on the
         # average distance driven with a set of fuel cells given
@@ -469,27 +1918,24 @@ class TruckModel(VehicleModel):
         # The number of replacement is rounded *up* as we assume
         # no allocation of burden with a second life
 
+        # the velocity profile does not depend on the vehicle parameters
         average_speed = (
             np.nanmean(
-                np.where(
-                    self.energy.sel(parameter="velocity") > 0,
-                    self.energy.sel(parameter="velocity"),
-                    np.nan,
-                ),
+                np.where(self.ecm.velocity > 0, self.ecm.velocity, np.nan),
                 0,
             )
             * 3.6
         )
 
-        self["fuel cell lifetime replacements"] = np.ceil(
+        view["fuel cell lifetime replacements"] = np.ceil(
             np.clip(
-                self["lifetime kilometers"]
-                / (average_speed.T * _(self["fuel cell lifetime hours"]))
+                view["lifetime kilometers"]
+                / (average_speed.T * _(view["fuel cell lifetime hours"]))
                 - 1,
                 0,
                 5,
             )
-        ) * (self["fuel cell lifetime hours"] > 0)
+        ) * (view["fuel cell lifetime hours"] > 0)
 
     def set_vehicle_masses(self):
         """
@@ -514,10 +1960,6 @@ class TruckModel(VehicleModel):
             "transmission mass",
         ]
 
-        self["curb mass"] = self[base_components].sum(axis=2) * (
-            1 - self["lightweighting"]
-        )
-
         curb_mass_includes = [
             "fuel mass",
             "charger mass",
@@ -537,40 +1979,63 @@ class TruckModel(VehicleModel):
             "battery BoP mass",
             "fuel tank mass",
         ]
-        self["curb mass"] += self[curb_mass_includes].sum(axis=2)
 
-        self["total cargo mass"] = (
-            self["average passengers"] * self["average passenger mass"]
-        ) + self["cargo mass"]
+        view = self.view
 
-        self["driving mass"] = (
-            self["curb mass"]
-            + self["cargo mass"]
-            + (self["average passengers"] * self["average passenger mass"])
+        # parameters not defined (NaN) are skipped, as by xarray
+        view.evaluate(
+            "curb mass",
+            "base * (1 - lightweighting) + includes",
+            base=np.nansum(view[base_components], axis=2),
+            lightweighting="lightweighting",
+            includes=np.nansum(view[curb_mass_includes], axis=2),
         )
 
-        self["available payload"] = (
-            self["gross mass"]
-            - self["curb mass"]
-            - (self["average passengers"] * self["average passenger mass"])
+        masses = dict(
+            passengers=view["average passengers"],
+            passenger_mass=view["average passenger mass"],
+            cargo=view["cargo mass"],
+            curb=view["curb mass"],
+            gross=view["gross mass"],
         )
-
-    def set_component_masses(self):
-        self["combustion engine mass"] = (
-            self["combustion power"] * self["engine mass per power"]
-            + self["engine fixed mass"]
+        view.evaluate(
+            "total cargo mass", "passengers * passenger_mass + cargo", **masses
+        )
+        view.evaluate(
+            "driving mass", "curb + cargo + passengers * passenger_mass", **masses
+        )
+        view.evaluate(
+            "available payload", "gross - curb - passengers * passenger_mass", **masses
         )
-        self["electric engine mass"] = np.clip(
-            (24.56 * np.exp(0.0078 * self["electric power"])), 0, 600
-        ) * (self["electric power"] > 0)
 
-        self["transmission mass"] = (self["gross mass"] / 1000) * self[
-            "transmission mass per ton of gross weight"
-        ]
+    def set_component_masses(self):
+        view = self.view
 
-        self["inverter mass"] = (
-            self["electric power"] * self["inverter mass per power"]
-            + self["inverter fix mass"]
+        view.evaluate(
+            "combustion engine mass",
+            "power * mass_per_power + fixed_mass",
+            power="combustion power",
+            mass_per_power="engine mass per power",
+            fixed_mass="engine fixed mass",
+        )
+        view.evaluate(
+            "electric engine mass",
+            "where(mass > 600, 600, mass) * (power > 0)",
+            mass=24.56 * np.exp(0.0078 * view["electric power"]),
+            power="electric power",
+        )
+        view.evaluate(
+            "transmission mass",
+            "(gross / 1000) * mass_per_ton",
+            gross="gross mass",
+            mass_per_ton="transmission mass per ton of gross weight",
+        )
+        view.evaluate(
+            "inverter mass",
+            "power * mass_per_power + fixed_mass",
+            power="electric power",
+            mass_per_power="inverter mass per power",
+            fixed_mass="inverter fix mass",
         )
 
     def set_electric_utility_factor(self, uf: float = None) -> None:
@@ -610,17 +2075,18 @@ class TruckModel(VehicleModel):
         Then batteries are sized, depending on the range required and the energy consumption.
         """
 
-        _ = lambda x: np.where(x == 0, 1, x)
         _nz = lambda x: np.where(x < 1, 1, x)
 
         self.set_average_lhv()
 
-        self["fuel mass"] = (
-            self["target range"]
-            * self["TtW energy"]
-            / 1000
-            / _(self["LHV fuel MJ per kg"])
-            * (self["LHV fuel MJ per kg"] > 0)
+        view = self.view
+
+        view.evaluate(
+            "fuel mass",
+            "target_range * energy / 1000 / where(lhv == 0, 1, lhv) * (lhv > 0)",
+            target_range="target range",
+            energy="TtW energy",
+            lhv="LHV fuel MJ per kg",
         )
 
         if "ICEV-g" in self.array.coords["powertrain"].values:
@@ -628,11 +2094,9 @@ class TruckModel(VehicleModel):
             # We use a four-cylinder configuration
             # Of 320L each
             # A cylinder of 320L @ 200 bar can hold 57.6 kg of CNG
-            nb_cylinder = np.ceil(
-                self.array.loc[dict(powertrain="ICEV-g", parameter="fuel mass")] / 57.6
-            )
+            nb_cylinder = np.ceil(view["fuel mass", "ICEV-g"] / 57.6)
 
-            self.array.loc[dict(powertrain="ICEV-g", parameter="fuel tank mass")] = (
+            view["fuel tank mass", "ICEV-g"] = (
                 (0.018 * np.power(57.6, 2)) - (0.6011 * 57.6) + 52.235
             ) * nb_cylinder
 
@@ -646,15 +2110,8 @@ class TruckModel(VehicleModel):
             # because we size here trucks based on the range autonomy
             # a low range autonomy would produce a negative fuel tank mass
 
-            self.array.loc[dict(powertrain=pt, parameter="fuel tank mass")] = np.clip(
-                17.159
-                * np.log(
-                    _nz(
-                        self.array.loc[dict(powertrain=pt, parameter="fuel mass")]
-                        * (1 / 0.832)
-                    )
-                )
-                - 30,
+            view["fuel tank mass", pt] = np.clip(
+                17.159 * np.log(_nz(view["fuel mass", pt] * (1 / 0.832))) - 30,
                 0,
                 None,
             )
@@ -664,11 +2121,9 @@ class TruckModel(VehicleModel):
             # We use a four-cylinder configuration
             # Of 650L each
             # A cylinder of 650L @ 700 bar can hold 14.4 kg of H2
-            nb_cylinder = np.ceil(
-                self.array.loc[dict(powertrain="FCEV", parameter="fuel mass")] / 14.4
-            )
+            nb_cylinder = np.ceil(view["fuel mass", "FCEV"] / 14.4)
 
-            self.array.loc[dict(powertrain="FCEV", parameter="fuel tank mass")] = (
+            view["fuel tank mass", "FCEV"] = (
                 (
                     -0.1916
                     * np.power(
@@ -680,17 +2135,21 @@ class TruckModel(VehicleModel):
                 + 10.805
             ) * nb_cylinder
 
-        self["oxidation energy stored"] = (
-            self["fuel mass"] * self["LHV fuel MJ per kg"] / 3.6
+        view.evaluate(
+            "oxidation energy stored",
+            "fuel_mass * lhv / 3.6",
+            fuel_mass="fuel mass",
+            lhv="LHV fuel MJ per kg",
         )
 
-        self["electric energy stored"] = (
-            self["target range"]
-            * self["TtW energy"]
-            / 1000
-            / _(self["battery DoD"])
-            / 3.6
-            * (self["combustion power share"] == 0)
+        view.evaluate(
+            "electric energy stored",
+            "target_range * energy / 1000 / where(dod == 0, 1, dod) / 3.6"
+            " * (combustion_share == 0)",
+            target_range="target range",
+            energy="TtW energy",
+            dod="battery DoD",
+            combustion_share="combustion power share",
         )
 
         if "FCEV" in self.array.powertrain.values:
@@ -698,29 +2157,31 @@ class TruckModel(VehicleModel):
             # corresponds roughly to 6% of the capacity contained in the
             # H2 tank
 
-            self.array.loc[
-                dict(powertrain="FCEV", parameter="electric energy stored")
-            ] = 20 + (
-                self.array.loc[dict(powertrain="FCEV", parameter="fuel mass")]
-                * 120
-                / 3.6
-                * 0.06
+            view["electric energy stored", "FCEV"] = 20 + (
+                view["fuel mass", "FCEV"] * 120 / 3.6 * 0.06
             )
 
-        self["battery cell mass"] = self["electric energy stored"] / _(
-            self["battery cell energy density"]
+        battery = dict(
+            energy=view["electric energy stored"],
+            density=view["battery cell energy density"],
+            cell_mass=view["battery cell mass"],
+            cell_share=view["battery cell mass share"],
+            battery_mass=view["energy battery mass"],
         )
-
-        self["energy battery mass"] = self["battery cell mass"] / _(
-            self["battery cell mass share"]
+        view.evaluate(
+            "battery cell mass",
+            "energy / where(density == 0, 1, density)",
+            **battery,
         )
-
-        self["battery BoP mass"] = (
-            self["energy battery mass"] - self["battery cell mass"]
+        view.evaluate(
+            "energy battery mass",
+            "cell_mass / where(cell_share == 0, 1, cell_share)",
+            **battery,
         )
+        view.evaluate("battery BoP mass", "battery_mass - cell_mass", **battery)
 
     def set_costs(self):
-        _nz = lambda x: np.where(x < 1, 1, x)
+        view = self.view
 
         glider_components = [
             "glider base mass",
@@ -730,66 +2191,60 @@ class TruckModel(VehicleModel):
             "cabin mass",
         ]
 
-        self["glider cost"] = np.clip(
-            (
-                (38747 * np.log(_nz(self[glider_components].sum(dim="parameter"))))
-                - 252194
-            ),
-            33500,
-            110000,
+        view.evaluate(
+            "glider cost",
+            "38747 * log(where(mass < 1, 1, mass)) - 252194",
+            mass=np.nansum(view[glider_components], axis=2),
         )
+        np.clip(view["glider cost"], 33500, 110000, out=view["glider cost"])
 
         # Discount glider cost for 40t and 60t trucks because of the added trailer mass
 
         for size in [
             s for s in ["40t", "60t"] if s in self.array.coords["size"].values
         ]:
-            self.array.loc[dict(parameter="glider cost", size=size)] *= 0.7
-
-        self["lightweighting cost"] = (
-            self["glider base mass"]
-            * self["lightweighting"]
-            * self["glider lightweighting cost per kg"]
-        )
-        self["electric powertrain cost"] = (
-            self["electric powertrain cost per kW"] * self["electric power"]
-        )
-        self["combustion powertrain cost"] = (
-            self["combustion power"] * self["combustion powertrain cost per kW"]
-        )
+            view["glider cost", None, size] *= 0.7
 
-        self["fuel cell cost"] = self["fuel cell power"] * self["fuel cell cost per kW"]
-
-        self["power battery cost"] = (
-            self["battery power"] * self["power battery cost per kW"]
-        )
-        self["energy battery cost"] = (
-            self["energy battery cost per kWh"] * self["electric energy stored"]
-        )
-        self["fuel tank cost"] = self["fuel tank cost per kg"] * self["fuel mass"]
-        # Per ton-km
-        self["energy cost"] = (
-            self["energy cost per kWh"]
-            * self["TtW energy"]
-            / 3600
-            / (self["cargo mass"] / 1000)
+        view.evaluate(
+            "lightweighting cost",
+            "mass * lightweighting * cost_per_kg",
+            mass="glider base mass",
+            lightweighting="lightweighting",
+            cost_per_kg="glider lightweighting cost per kg",
         )
 
-        # For battery, need to divide cost of electricity in battery by efficiency of charging
-        for pt in [
-            pwt
-            for pwt in ["BEV", "PHEV-e"]
-            if pwt in self.array.coords["powertrain"].values
+        # cost of each component, as the product of a cost per unit and a size
+        for cost, cost_per_unit, size in [
+            (
+                "electric powertrain cost",
+                "electric powertrain cost per kW",
+                "electric power",
+            ),
+            (
+                "combustion powertrain cost",
+                "combustion powertrain cost per kW",
+                "combustion power",
+            ),
+            ("fuel cell cost", "fuel cell cost per kW", "fuel cell power"),
+            ("power battery cost", "power battery cost per kW", "battery power"),
+            (
+                "energy battery cost",
+                "energy battery cost per kWh",
+                "electric energy stored",
+            ),
+            ("fuel tank cost", "fuel tank cost per kg", "fuel mass"),
         ]:
-            self.array.loc[
-                dict(powertrain=pt, parameter="energy cost")
-            ] /= self.array.loc[
-                dict(powertrain=pt, parameter="battery charge efficiency")
-            ]
+            view.evaluate(
+                cost, "cost_per_unit * size", cost_per_unit=cost_per_unit, size=size
+            )
 
-        self["component replacement cost"] = (
-            self["energy battery cost"] * self["battery lifetime replacements"]
-            + self["fuel cell cost"] * self["fuel cell lifetime replacements"]
+        view.evaluate(
+            "component replacement cost",
+            "battery_cost * battery_replacements + fuel_cell_cost * fuel_cell_replacements",
+            battery_cost="energy battery cost",
+            battery_replacements="battery lifetime replacements",
+            fuel_cell_cost="fuel cell cost",
+            fuel_cell_replacements="fuel cell lifetime replacements",
         )
 
         to_markup = [
@@ -804,13 +2259,7 @@ class TruckModel(VehicleModel):
             "power battery cost",
         ]
 
-        self[to_markup] *= self["markup factor"]
-
-        # calculate costs per km:
-        self["lifetime"] = self["lifetime kilometers"] / self["kilometers per year"]
-        i = self["interest rate"]
-        lifetime = self["lifetime"]
-        amortisation_factor = ne.evaluate("i + (i / ((1 + i) ** lifetime - 1))")
+        view[to_markup] *= view["markup factor"][:, :, None]
 
         purchase_cost_list = [
             "battery onboard charging infrastructure cost",
@@ -826,49 +2275,75 @@ class TruckModel(VehicleModel):
             "power battery cost",
         ]
 
-        self["purchase cost"] = self[purchase_cost_list].sum(axis=2)
+        view["purchase cost"] = np.nansum(view[purchase_cost_list], axis=2)
 
-        # per ton-km
-        self["amortised purchase cost"] = (
-            self["purchase cost"]
-            * amortisation_factor
-            / (self["cargo mass"] / 1000)
-            / self["kilometers per year"]
+        # calculate costs per km:
+        inputs = {name: view[name] for name in COST_PER_KM_INPUTS}
+        # For battery, need to divide cost of electricity in battery by efficiency of charging
+        inputs["charge efficiency"] = np.where(
+            np.isin(self.array.coords["powertrain"].values, ["BEV", "PHEV-e"])[
+                None, :, None, None
+            ],
+            view["battery charge efficiency"],
+            1,
         )
 
-        # per km
-        self["adblue cost"] = (
-            self["adblue cost per kg"] * 0.06 * self["fuel mass"]
-        ) / self["target range"]
-        self["maintenance cost"] = self["maintenance cost per km"]
-        self["maintenance cost"] += self["adblue cost"]
-        self["maintenance cost"] /= self["cargo mass"] / 1000
-
-        self["insurance cost"] = (
-            self["insurance cost per year"]
-            / (self["cargo mass"] / 1000)
-            / self["kilometers per year"]
-        )
+        for parameter, values in get_costs_per_km(inputs).items():
+            view[parameter] = values
 
-        self["toll cost"] = self["toll cost per km"] / (self["cargo mass"] / 1000)
+    @contextmanager
+    def per_second_energy(self):
+        """
+        Within the block, :attr:`energy` holds outputs of the energy consumption model
+        for each second of the driving cycle, as read by the emission methods of
+        :class:`carculator_utils.model.VehicleModel`: an :class:`EnergyProfile` built
+        from :attr:`energy_profile` and the velocity of :attr:`ecm`, unless :attr:`energy`
+        is already kept for each second (see `keep_energy`).
 
-        # simple assumption that component replacement occurs at half of life.
-        km_per_year = self["kilometers per year"]
-        com_repl_cost = self["component replacement cost"]
-        cargo = self["cargo mass"] / 1000
+        :raises ValueError: if the energy consumption of each second was not kept
+        """
 
-        self["amortised component replacement cost"] = ne.evaluate(
-            "(com_repl_cost * ((1 - i) ** lifetime / 2) * amortisation_factor) / km_per_year / cargo"
-        )
+        if self.keep_energy:
+            yield
+            return
 
-        self["total cost per km"] = (
-            self["energy cost"]
-            + self["amortised purchase cost"]
-            + self["maintenance cost"]
-            + self["insurance cost"]
-            + self["toll cost"]
-            + self["amortised component replacement cost"]
+        if self.energy_profile is None:
+            raise ValueError(
+                "The energy consumption of each second of the driving cycle "
+                "is not kept: emissions cannot be calculated."
+            )
+
+        energy, self.energy = self.energy, EnergyProfile(
+            self.ecm.velocity, self.energy_profile
         )
+        try:
+            yield
+        finally:
+            self.energy = energy
+
+    def set_hot_emissions(self):
+        """
+        See :meth:`carculator_utils.model.VehicleModel.set_hot_emissions`.
+        """
+
+        with self.per_second_energy():
+            super().set_hot_emissions()
+
+    def set_particulates_emission(self):
+        """
+        See :meth:`carculator_utils.model.VehicleModel.set_particulates_emission`.
+        """
+
+        with self.per_second_energy():
+            super().set_particulates_emission()
+
+    def set_noise_emissions(self):
+        """
+        See :meth:`carculator_utils.model.VehicleModel.set_noise_emissions`.
+        """
+
+        with self.per_second_energy():
+            super().set_noise_emissions()
 
     def calculate_cost_impacts(self, sensitivity=False, scope=None):
         """
@@ -880,10 +2355,25 @@ class TruckModel(VehicleModel):
         * Energy
         * Total cost of ownership
 
+        If the vehicles were sized for several driving cycles, the costs
+        are returned along a `cycle` dimension.
+
         :return: A xarray array with cost information per vehicle-km
         :rtype: xarray.core.dataarray.DataArray
         """
 
+        if "cycle" in self.array.dims:
+            return xr.concat(
+                [
+                    self.get_cycle(cycle).calculate_cost_impacts(
+                        sensitivity=sensitivity,
+                        scope=dict(scope) if scope is not None else None,
+                    )
+                    for cycle in self.array.coords["cycle"].values.tolist()
+                ],
+                dim="cycle",
+            ).assign_coords(cycle=self.array.coords["cycle"].values)
+
         if scope is None:
             scope = {
                 "size": self.array.coords["size"].values.tolist(),
@@ -897,15 +2387,7 @@ class TruckModel(VehicleModel):
             )
             scope["year"] = scope.get("year", self.array.coords["year"].values.tolist())
 
-        list_cost_cat = [
-            "purchase",
-            "maintenance",
-            "insurance",
-            "toll",
-            "component replacement",
-            "energy",
-            "total",
-        ]
+        list_cost_cat = list(COST_TYPES)
 
         response = xr.DataArray(
             np.zeros(
@@ -931,15 +2413,7 @@ class TruckModel(VehicleModel):
             powertrain=scope["powertrain"],
             size=scope["size"],
             year=scope["year"],
-            parameter=[
-                "amortised purchase cost",
-                "maintenance cost",
-                "insurance cost",
-                "toll cost",
-                "amortised component replacement cost",
-                "energy cost",
-                "total cost per km",
-            ],
+            parameter=list(COST_TYPES.values()),
         ).values
 
         if not sensitivity:
@@ -947,14 +2421,164 @@ class TruckModel(VehicleModel):
         else:
             return response / response.sel(value="reference")
 
+    def calculate_cost_sweep(self, sweep: dict, scope: dict = None) -> xr.DataArray:
+        """
+        Return the costs per ton-km of the sized vehicles, as :meth:`calculate_cost_impacts`
+        does, for each combination of values of the cost parameters in `sweep`.
+        For example::
+
+            tm.set_all()
+            tco = tm.calculate_cost_sweep(
+                {
+                    "interest rate": np.linspace(0.01, 0.1, 10),
+                    "energy cost per kWh": np.linspace(0.05, 0.5, 10),
+                }
+            )
+            tco.sel(cost_type="total", powertrain="BEV", size="40t", year=2020)
+
+        Each parameter in `sweep` is given its values for all vehicles, along a new
+        dimension of the same name, and the costs are calculated by broadcasting
+        the parameters against one another. Vehicles are not sized again,
+        and :attr:`array` is left unchanged. Only the parameters in `COST_SWEEP_PARAMETERS`
+        can be swept: other parameters are changed with :meth:`recompute`.
+
+        The result holds one value per vehicle, cost type and combination of values:
+        large grids call for a narrow `scope`. If the vehicles were sized for several
+        driving cycles, the costs are returned along a leading `cycle` dimension.
+
+        :param sweep: values of each swept parameter, as a sequence of numbers
+        :param scope: sizes, powertrains and years to return, as in :meth:`calculate_cost_impacts`
+        :return: costs per ton-km, with dimensions (size, powertrain, cost_type,
+            year, value), followed by one dimension per swept parameter
+        :raises ValueError: if a parameter cannot be swept, or if the vehicles are not sized yet
+        """
+
+        if self.sizing_iterations is None:
+            raise ValueError("Vehicles must be sized first, with set_all().")
+
+        if "cycle" in self.array.dims:
+            return xr.concat(
+                [
+                    self.get_cycle(cycle).calculate_cost_sweep(sweep, scope=scope)
+                    for cycle in self.array.coords["cycle"].values.tolist()
+                ],
+                dim="cycle",
+            ).assign_coords(cycle=self.array.coords["cycle"].values)
+
+        unknown = [name for name in sweep if name not in COST_SWEEP_PARAMETERS]
+        if unknown:
+            raise ValueError(
+                f"{', '.join(unknown)} cannot be swept. Valid parameters are: "
+                f"{', '.join(COST_SWEEP_PARAMETERS)}."
+            )
+
+        scope = {
+            dim: (scope or {}).get(dim, self.array.coords[dim].values.tolist())
+            for dim in ["size", "powertrain", "year"]
+        }
+        values = {
+            name: xr.DataArray(
+                np.asarray(sweep[name], dtype=self.array.dtype),
+                coords={name: np.asarray(sweep[name])},
+                dims=name,
+            )
+            for name in sweep
+        }
+
+        parameters = COST_PER_KM_INPUTS + ["battery charge efficiency"]
+
+        def costs(source, powertrains):
+            array = source.sel(
+                size=scope["size"],
+                powertrain=powertrains,
+                year=scope["year"],
+                parameter=parameters,
+            )
+            # as used by `set_costs`, before the energy consumption
+            # of unavailable vehicles is set to zero
+            if self.ttw_energy is not None and set(powertrains) <= set(
+                self.ttw_energy.coords["powertrain"].values
+            ):
+                array.loc[dict(parameter="TtW energy")] = (
+                    self.ttw_energy.sel(
+                        size=scope["size"], powertrain=powertrains, year=scope["year"]
+                    )
+                    .transpose(*array.sel(parameter="TtW energy").dims)
+                    .values
+                )
+
+            inputs = {name: array.sel(parameter=name, drop=True) for name in parameters}
+            inputs.update(values)
+            inputs["charge efficiency"] = inputs["battery charge efficiency"].where(
+                array.coords["powertrain"].isin(["BEV", "PHEV-e"]), 1
+            )
+
+            return calculate_costs_per_km(inputs)
+
+        response = costs(self.array, scope["powertrain"])
+
+        # plugin hybrids are calculated from their electric
+        # and combustion modes (see `create_PHEV`)
+        hybrids = self.hybrids if self.hybrids is not None else self.array
+        for pwt, pwtc in (("PHEV-d", "PHEV-c-d"), ("PHEV-p", "PHEV-c-p")):
+            if (
+                pwt not in scope["powertrain"]
+                or pwtc not in hybrids.coords["powertrain"].values
+            ):
+                continue
+
+            modes = costs(hybrids, ["PHEV-e", pwtc])
+            uf = hybrids.sel(
+                size=scope["size"],
+                powertrain="PHEV-e",
+                year=scope["year"],
+                parameter="electric utility factor",
+                drop=True,
+            )
+            blend = modes.sel(powertrain="PHEV-e", drop=True) * uf + modes.sel(
+                powertrain=pwtc, drop=True
+            ) * (1 - uf)
+            response.loc[dict(powertrain=pwt)] = blend.transpose(
+                *response.sel(powertrain=pwt).dims
+            ).values
+
+        cargo = self.array.sel(
+            size=scope["size"],
+            powertrain=scope["powertrain"],
+            year=scope["year"],
+            parameter="cargo mass",
+            drop=True,
+        )
+
+        return (response * (cargo > 100)).transpose(
+            "size", "powertrain", "cost_type", "year", "value", *values
+        )
+
+    def drop_hybrid(self):
+        """
+        Drop the electric and combustion modes of plugin hybrids, once
+        PHEV-d is calculated from them (see :meth:`create_PHEV`).
+        They are kept in :attr:`hybrids`, along with the plugin hybrids,
+        to calculate PHEV-d again in :meth:`recompute`.
+        """
+
+        hybrids = [
+            pt
+            for pt in self.array.coords["powertrain"].values
+            if pt in ["PHEV-e", "PHEV-c-p", "PHEV-c-d", "PHEV-d", "PHEV-p"]
+        ]
+        self.hybrids = self.array.sel(powertrain=hybrids) if hybrids else None
+
+        super().drop_hybrid()
+
     def remove_energy_consumption_from_unavailable_vehicles(self):
         """
         This method sets the energy consumption of vehicles that are not available to zero.
+        The energy consumption of all vehicles is kept in :attr:`ttw_energy`,
+        for :meth:`recompute`.
         """
 
-        print("")
-        print("'-' vehicle with driving mass superior to the permissible gross weight.")
-        print("'/' vehicle not available for the specified year.")
+        self.ttw_energy = self["TtW energy"].copy()
 
         self["is_compliant"] *= self["driving mass"] < self["gross mass"]
 
@@ -983,6 +2607,16 @@ class TruckModel(VehicleModel):
             (self["is_available"] == 0), 0, self["TtW energy"]
         )
 
+    def display_payloads(self):
+        """
+        Print the payload of each vehicle, and flag vehicles that
+        are not compliant or not available.
+        """
+
+        print("")
+        print("'-' vehicle with driving mass superior to the permissible gross weight.")
+        print("'/' vehicle not available for the specified year.")
+
         t = PrettyTable(
             ["Payload (in tons)"] + self.array.coords["size"].values.tolist()
         )
@@ -0,0 +1,346 @@
+"""
+parameter_store.py contains functions to compile the default input parameters
+(`data/default_parameters.json`) into an indexed NumPy archive, and to load them from it.
+
+The archive stores the numeric values needed by :meth:`TruckInputParameters.static` and
+:meth:`TruckInputParameters.stochastic` as columns, indexed by parameter name, powertrain,
+size and year. Free-text metadata (unit, source, comment, etc.) are stored separately,
+and only read when accessed. The archive keeps the size, modification time and hash
+of the JSON file it was built from. The JSON file is only hashed when its size or
+modification time differ (e.g., after a checkout), and the archive is built again
+when the hash differs too. The archive is written to a temporary file first, and
+moved into place, so that processes loading the parameters concurrently never read
+a partially written archive.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+import zipfile
+from collections.abc import Mapping
+from functools import lru_cache
+from math import isnan
+from pathlib import Path
+
+import numpy as np
+
+# fields passed to `klausen` to calculate the values of the parameters
+NUMERIC_FIELDS = ("amount", "loc", "minimum", "maximum")
+# fields used to index the parameters
+INDEX_FIELDS = ("name", "powertrain", "sizes", "year")
+# errors raised when reading a missing, truncated or outdated archive
+UNREADABLE = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+
+def get_store_path(source: Path) -> Path:
+    """
+    Return the path of the archive compiled from a JSON file of parameters.
+
+    :param source: path to the JSON file
+    :return: path to the archive, next to the JSON file
+    """
+    return Path(source).with_suffix(".npz")
+
+
+def hash_file(filepath: Path) -> str:
+    """
+    Return the SHA-1 hash of the contents of a file.
+
+    :param filepath: path to the file
+    :return: hexadecimal digest
+    """
+    return hashlib.sha1(Path(filepath).read_bytes()).hexdigest()
+
+
+def get_file_stamp(filepath: Path) -> tuple:
+    """
+    Return the size and modification time of a file, used to tell cheaply
+    whether a file changed, without reading it.
+
+    :param filepath: path to the file
+    :return: tuple (size in bytes, modification time in nanoseconds)
+    """
+    stat = os.stat(filepath)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def ragged(lists: list, labels: list) -> tuple:
+    """
+    Encode lists of labels as indices into `labels`, concatenated,
+    with the offset of each list.
+
+    :param lists: list of lists of labels
+    :param labels: sorted list of all labels
+    :return: tuple (indices, offsets)
+    """
+
+    position = {label: i for i, label in enumerate(labels)}
+    indices = np.array([position[v] for values in lists for v in values], dtype=int)
+    offsets = np.cumsum([0] + [len(values) for values in lists])
+
+    return indices, offsets
+
+
+def build_parameter_store(source: Path, target: Path = None) -> Path:
+    """
+    Compile a JSON file of parameters into an indexed NumPy archive.
+
+    :param source: path to the JSON file
+    :param target: path to the archive. Defaults to the JSON file, with a `.npz` extension.
+    :return: path to the archive
+    """
+
+    target = Path(target) if target is not None else get_store_path(source)
+
+    # the stamp is taken before reading, so that a concurrent change
+    # of the JSON file makes the archive outdated
+    source_stamp = get_file_stamp(source)
+    contents = Path(source).read_bytes()
+    parameters = json.loads(contents)
+
+    entries = list(parameters.values())
+    names = sorted({e["name"] for e in entries})
+    kinds = sorted({e["kind"] for e in entries})
+    powertrains = sorted({p for e in entries for p in e["powertrain"]})
+    sizes = sorted({s for e in entries for s in e["sizes"]})
+
+    powertrain_index, powertrain_offsets = ragged(
+        [e["powertrain"] for e in entries], powertrains
+    )
+    size_index, size_offsets = ragged([e["sizes"] for e in entries], sizes)
+
+    text = [
+        {
+            k: v
+            for k, v in e.items()
+            if k not in INDEX_FIELDS + NUMERIC_FIELDS + ("kind", "uncertainty_type")
+        }
+        for e in entries
+    ]
+
+    arrays = dict(
+        source_hash=np.array(hashlib.sha1(contents).hexdigest()),
+        source_stamp=np.array(source_stamp, dtype=np.int64),
+        keys=np.array(list(parameters)),
+        names=np.array(names),
+        name=np.array([names.index(e["name"]) for e in entries]),
+        year=np.array([e["year"] for e in entries]),
+        kinds=np.array(kinds),
+        kind=np.array([kinds.index(e["kind"]) for e in entries]),
+        uncertainty_type=np.array([e["uncertainty_type"] for e in entries]),
+        powertrains=np.array(powertrains),
+        powertrain_index=powertrain_index,
+        powertrain_offsets=powertrain_offsets,
+        sizes=np.array(sizes),
+        size_index=size_index,
+        size_offsets=size_offsets,
+        text=np.array(json.dumps(text)),
+        **{
+            field: np.array([e.get(field, np.nan) for e in entries], dtype=float)
+            for field in NUMERIC_FIELDS
+        },
+    )
+
+    with tempfile.NamedTemporaryFile(
+        dir=target.parent, prefix=f".{target.stem}-", suffix=".npz", delete=False
+    ) as file:
+        try:
+            np.savez_compressed(file, **arrays)
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
+    try:
+        # temporary files are only readable by their owner
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, target)
+    except OSError:
+        os.remove(file.name)
+        raise
+
+    return target
+
+
+def is_fresh(source: Path, target: Path = None, source_hash: str = None) -> bool:
+    """
+    Return True if the archive can be read and was built from the current JSON file.
+    The JSON file is only hashed if its size or modification time changed since
+    the archive was built.
+
+    :param source: path to the JSON file
+    :param target: path to the archive
+    :param source_hash: hash of the JSON file, if already known
+    :return: bool
+    """
+
+    target = Path(target) if target is not None else get_store_path(source)
+
+    try:
+        with np.load(target) as store:
+            stored_hash = str(store["source_hash"])
+            stored_stamp = tuple(store["source_stamp"].tolist())
+    except UNREADABLE:
+        return False
+
+    if stored_stamp == get_file_stamp(source):
+        return True
+
+    return stored_hash == (source_hash or hash_file(source))
+
+
+@lru_cache(maxsize=None)
+def load_text_metadata(target: Path, stamp: tuple) -> list:
+    """
+    Load the free-text metadata of an archive, once per process
+    for a given version of the archive.
+
+    :param target: path to the archive
+    :param stamp: size and modification time of the archive
+    :return: list of dictionaries, one per parameter
+    """
+
+    with np.load(target) as store:
+        return json.loads(str(store["text"]))
+
+
+class ParameterMetadata(Mapping):
+    """
+    Metadata of a parameter. Name, powertrains, sizes and year are
+    stored in the mapping, and free-text fields are read from the
+    archive the first time they are accessed.
+    """
+
+    def __init__(self, fields: dict, target: Path, stamp: tuple, position: int) -> None:
+        """
+        :param fields: name, powertrains, sizes and year of the parameter
+        :param target: path to the archive
+        :param stamp: size and modification time of the archive
+        :param position: position of the parameter in the archive
+        """
+        self.fields = fields
+        self.target = target
+        self.stamp = stamp
+        self.position = position
+        self.loaded = False
+
+    def load(self) -> dict:
+        if not self.loaded:
+            self.fields.update(
+                load_text_metadata(self.target, self.stamp)[self.position]
+            )
+            self.loaded = True
+        return self.fields
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            return self.fields[key]
+        return self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+    def __repr__(self) -> str:
+        return repr(self.load())
+
+
+@lru_cache(maxsize=None)
+def read_parameter_store(target: Path, stamp: tuple) -> tuple:
+    """
+    Read the values and index of the parameters of an archive, once per
+    process for a given version of the archive.
+
+    :param target: path to the archive
+    :param stamp: size and modification time of the archive
+    :return: tuple (data, metadata, labels), see :func:`load_parameter_store`
+    """
+
+    with np.load(target) as store:
+        keys = store["keys"].tolist()
+        names = store["names"][store["name"]].tolist()
+        years = store["year"].tolist()
+        kinds = store["kinds"][store["kind"]].tolist()
+        uncertainty_types = store["uncertainty_type"].tolist()
+        numeric = [store[field] for field in NUMERIC_FIELDS]
+
+        powertrains = store["powertrains"][store["powertrain_index"]].tolist()
+        powertrain_offsets = store["powertrain_offsets"].tolist()
+        sizes = store["sizes"][store["size_index"]].tolist()
+        size_offsets = store["size_offsets"].tolist()
+
+        labels = {
+            "sizes": store["sizes"].tolist(),
+            "powertrains": store["powertrains"].tolist(),
+            "names": store["names"].tolist(),
+            "years": sorted(set(years)),
+        }
+
+    # missing values (e.g., bounds of parameters without uncertainty) are NaN
+    numeric = zip(*(values.tolist() for values in numeric))
+
+    data, metadata = {}, {}
+    for i, (key, values) in enumerate(zip(keys, numeric)):
+        data[key] = {"kind": kinds[i], "uncertainty_type": uncertainty_types[i]}
+        data[key].update(
+            (field, v) for field, v in zip(NUMERIC_FIELDS, values) if not isnan(v)
+        )
+
+        metadata[key] = ParameterMetadata(
+            {
+                "name": names[i],
+                "powertrain": powertrains[
+                    powertrain_offsets[i] : powertrain_offsets[i + 1]
+                ],
+                "sizes": sizes[size_offsets[i] : size_offsets[i + 1]],
+                "year": years[i],
+            },
+            target,
+            stamp,
+            i,
+        )
+
+    return data, metadata, labels
+
+
+def load_parameter_store(source: Path) -> tuple:
+    """
+    Load the parameters of a JSON file from its compiled archive.
+    The archive is built first if it is missing, unreadable or outdated. If it
+    cannot be written or read, None is returned, and the JSON file should be
+    read instead.
+
+    :param source: path to the JSON file
+    :return: tuple (data, metadata, labels): the values and metadata of each
+        parameter, as stored by :class:`klausen.NamedParameters`, and the sorted
+        sizes, powertrains, names and years of the parameters
+    """
+
+    target = get_store_path(source).resolve()
+
+    if not is_fresh(source, target):
+        try:
+            build_parameter_store(source, target)
+        except OSError:
+            warnings.warn(
+                f"The parameters of {source} could not be compiled to {target}."
+            )
+            return None
+
+    try:
+        data, metadata, labels = read_parameter_store(target, get_file_stamp(target))
+    except UNREADABLE:
+        warnings.warn(f"The parameters of {source} could not be read from {target}.")
+        return None
+
+    # values can be changed by the caller (e.g., by :meth:`klausen.NamedParameters.static`)
+    return {key: dict(values) for key, values in data.items()}, metadata, labels
+
+
+if __name__ == "__main__":
+    from .truck_input_parameters import DEFAULT
+
+    print(f"Parameters compiled to {build_parameter_store(DEFAULT)}.")
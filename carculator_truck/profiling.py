@@ -0,0 +1,159 @@
+"""
+profiling.py contains an optional profiler, which records the wall time of the
+stages of :meth:`TruckModel.set_all` and :meth:`InventoryTruck.fill_in_A_matrix`,
+with the sizes of the arrays they work on.
+
+Stages are only recorded within a :func:`profile` block::
+
+    with profile(trace_file="trace.json") as profiler:
+        tm.set_all()
+        InventoryTruck(tm).calculate_impacts()
+
+The trace file can be opened in Perfetto (https://ui.perfetto.dev) or in
+`chrome://tracing`. Stages run by worker processes (e.g., with `n_workers`)
+are not recorded. Outside of a :func:`profile` block, :func:`stage`
+returns a shared, empty context manager.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable
+
+# profiler of the current `profile` block, if any
+ACTIVE = None
+NO_STAGE = nullcontext()
+
+
+def get_sizes(array):
+    """
+    Return the sizes of an array, to be recorded with a stage.
+
+    :param array: xarray.DataArray, array with a `shape`, or None
+    :return: dictionary of dimension sizes, shape, or None
+    """
+
+    if array is None:
+        return None
+    if hasattr(array, "sizes"):
+        return {str(dim): int(size) for dim, size in array.sizes.items()}
+    return [int(n) for n in array.shape]
+
+
+class Profiler:
+    """
+    Record the stages run within a :func:`profile` block.
+
+    :ivar events: recorded stages, as dictionaries with the name, start time
+        and duration (in seconds) and array sizes of each stage,
+        in the order in which the stages ended
+    :vartype events: list
+    """
+
+    def __init__(self, callback: Callable = None) -> None:
+        """
+        :param callback: function called at the end of each stage,
+            with the name, wall time (in seconds) and array sizes of the stage
+        """
+        self.callback = callback
+        self.events = []
+        self.origin = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, array=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            sizes = get_sizes(array)
+            self.events.append(
+                {
+                    "name": name,
+                    "start": start - self.origin,
+                    "duration": duration,
+                    "sizes": sizes,
+                    "thread": threading.get_ident(),
+                }
+            )
+            if self.callback is not None:
+                self.callback(name, duration, sizes)
+
+    def to_trace(self) -> dict:
+        """
+        Return the recorded stages in the Chrome trace event format.
+
+        :return: dictionary, to be serialised to JSON
+        """
+
+        return {
+            "traceEvents": [
+                {
+                    "name": event["name"],
+                    "ph": "X",
+                    "ts": event["start"] * 1e6,
+                    "dur": event["duration"] * 1e6,
+                    "pid": os.getpid(),
+                    "tid": event["thread"],
+                    "args": {"sizes": event["sizes"]},
+                }
+                for event in self.events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_trace(self, filepath) -> Path:
+        """
+        Write the recorded stages to a Chrome trace (JSON) file.
+
+        :param filepath: path to the file
+        :return: path to the file
+        """
+
+        filepath = Path(filepath)
+        with open(filepath, "w", encoding="utf-8") as file:
+            json.dump(self.to_trace(), file)
+
+        return filepath
+
+
+@contextmanager
+def profile(callback: Callable = None, trace_file=None):
+    """
+    Record the stages run within the block.
+
+    :param callback: function called at the end of each stage,
+        with the name, wall time (in seconds) and array sizes of the stage
+    :param trace_file: if given, path to a Chrome trace file written at the end of the block
+    :return: :class:`Profiler` object
+    """
+
+    global ACTIVE
+
+    previous, ACTIVE = ACTIVE, Profiler(callback)
+    profiler = ACTIVE
+    try:
+        yield profiler
+    finally:
+        ACTIVE = previous
+        if trace_file is not None:
+            profiler.write_trace(trace_file)
+
+
+def stage(name: str, array=None):
+    """
+    Return a context manager recording the wall time of a stage,
+    if a :func:`profile` block is active.
+
+    :param name: name of the stage
+    :param array: array the stage works on, whose sizes are recorded
+    :return: context manager
+    """
+
+    if ACTIVE is None:
+        return NO_STAGE
+
+    return ACTIVE.stage(name, array)
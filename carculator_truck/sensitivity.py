@@ -0,0 +1,145 @@
+"""
+sensitivity.py contains functions to run a one-at-a-time sensitivity analysis
+of the vehicles. Each input parameter is perturbed in its own iteration of the
+`value` dimension of a single array, next to a `reference` iteration, so that
+the vehicles are sized and their impacts calculated in one pass::
+
+    tip = TruckInputParameters()
+    tip.static()
+    _, array = fill_xarray_from_input_parameters(tip)
+    elasticities = calculate_elasticities(array, model_kwargs={"cycle": "Long haul"})
+    elasticities.sel(output="climate change", size="40t", powertrain="BEV", year=2020)
+
+Iterations are sized and solved independently, so that the perturbed iterations
+give the same results as models run with one perturbed parameter each.
+"""
+
+import numpy as np
+import xarray as xr
+
+from .inventory import InventoryTruck
+from .model import COST_TYPES, TruckModel
+
+
+def get_sensitivity_array(
+    array: xr.DataArray, parameters: list = None, variation: float = 0.1
+) -> xr.DataArray:
+    """
+    Return a copy of a static array, with a `reference` iteration of the `value`
+    dimension, followed by one iteration per parameter of `parameters`, in which
+    the parameter is multiplied by 1 + `variation`. Iterations are labelled
+    by the name of the perturbed parameter.
+
+    :param array: array of input parameters, with a single iteration,
+        as returned by :func:`carculator_utils.array.fill_xarray_from_input_parameters`
+    :param parameters: names of the parameters to perturb. If not given,
+        all parameters with a non-zero value are perturbed.
+    :param variation: relative change of the perturbed parameters
+    :return: array with 1 + len(`parameters`) iterations
+    :raises ValueError: if the array has several iterations,
+        or if a parameter is not in the array
+    """
+
+    if array.sizes["value"] != 1:
+        raise ValueError(
+            "A sensitivity analysis is run from a static array, with a single iteration."
+        )
+
+    names = array.coords["parameter"].values.tolist()
+    if parameters is None:
+        parameters = [
+            name
+            for name, non_zero in zip(
+                names, (array != 0).any(dim=[d for d in array.dims if d != "parameter"])
+            )
+            if non_zero
+        ]
+
+    unknown = [p for p in parameters if p not in names]
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(unknown)}.")
+
+    values = ["reference"] + list(parameters)
+    data = np.repeat(array.values, len(values), axis=array.dims.index("value"))
+
+    index = array.get_index("parameter")
+    for i, parameter in enumerate(parameters, start=1):
+        selection = [slice(None)] * array.ndim
+        selection[array.dims.index("parameter")] = index.get_loc(parameter)
+        selection[array.dims.index("value")] = i
+        data[tuple(selection)] *= 1 + variation
+
+    sensitivity = xr.DataArray(
+        data,
+        coords={
+            dim: values if dim == "value" else array.coords[dim].values
+            for dim in array.dims
+        },
+        dims=array.dims,
+    )
+
+    return sensitivity
+
+
+def calculate_elasticities(
+    array: xr.DataArray,
+    parameters: list = None,
+    variation: float = 0.1,
+    model_kwargs: dict = None,
+    set_all_kwargs: dict = None,
+    inventory_kwargs: dict = None,
+    impacts: bool = True,
+) -> xr.DataArray:
+    """
+    Return the elasticity of the costs and impacts of the vehicles to each parameter
+    of `parameters`: the relative change of each output, divided by the relative change
+    of the parameter. The perturbed copies of all parameters are sized by a single call
+    to :meth:`TruckModel.set_all`, and their impacts calculated by a single call
+    to :meth:`InventoryTruck.calculate_impacts`.
+
+    Parameters overwritten while sizing the vehicles (e.g., cargo mass, unless
+    `payload` is given, or the costs of energy storage, see :meth:`TruckModel.adjust_cost`)
+    have an elasticity of zero. The sizing of the vehicles converges within `tolerance`
+    (see :meth:`TruckModel.set_all`): a lower tolerance, given in `set_all_kwargs`,
+    reduces the noise on small elasticities of mass-dependent outputs.
+
+    :param array: array of input parameters, with a single iteration
+    :param parameters: names of the parameters to perturb (see :func:`get_sensitivity_array`)
+    :param variation: relative change of the perturbed parameters
+    :param model_kwargs: arguments passed to :class:`TruckModel` (e.g., `cycle`, `country`)
+    :param set_all_kwargs: arguments passed to :meth:`TruckModel.set_all`. Iterations
+        can be sized by chunks (`chunk_size`, `n_workers`): as they hold no random draws
+        (see :attr:`TruckModel.stochastic`), the elasticities do not depend on chunking.
+    :param inventory_kwargs: arguments passed to :class:`InventoryTruck` (e.g., `method`).
+        The inventory is stored as a sparse matrix, unless `sparse_matrix` is False, as it
+        holds one iteration per parameter. Iterations cannot be solved by chunks
+        (`chunk_size`, `n_workers`).
+    :param impacts: if False, only the elasticities of the costs are calculated,
+        without building the inventory
+    :return: elasticities, with dimensions (parameter, output, size, powertrain, year).
+        Outputs are the cost parameters (see `COST_TYPES`), followed by the impact categories.
+    """
+
+    tm = TruckModel(
+        get_sensitivity_array(array, parameters, variation), **(model_kwargs or {})
+    )
+    tm.set_all(**(set_all_kwargs or {}))
+
+    outputs = [
+        tm.calculate_cost_impacts(sensitivity=True)
+        .rename(cost_type="output")
+        .assign_coords(output=list(COST_TYPES.values()))
+    ]
+    if impacts:
+        outputs.append(
+            InventoryTruck(tm, **{"sparse_matrix": True, **(inventory_kwargs or {})})
+            .calculate_impacts(sensitivity=True)
+            .rename(impact_category="output")
+        )
+
+    ratios = xr.concat(outputs, dim="output")
+    ratios = ratios.drop_sel(value="reference").rename(value="parameter")
+
+    return ((ratios - 1) / variation).transpose(
+        "parameter", "output", "size", "powertrain", "year", ...
+    )
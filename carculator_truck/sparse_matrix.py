@@ -0,0 +1,223 @@
+"""
+sparse_matrix.py contains SparseAMatrix, a sparse storage for the A matrix of the inventory.
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+def compact_index(index, size: int):
+    """
+    Return the positions an index refers to along an axis of length `size`,
+    and the index remapped to these positions, so that indexing an array
+    gathered at these positions with the remapped index gives the same
+    result as indexing the full axis with `index`.
+
+    :param index: integer, slice, list or array of integers or booleans
+    :param size: length of the axis
+    :return: tuple (positions, remapped index)
+    """
+
+    if isinstance(index, slice):
+        return np.arange(size)[index], slice(None)
+
+    if isinstance(index, (int, np.integer)):
+        return np.array([index % size]), 0
+
+    index = np.asarray(index)
+    if index.dtype == bool:
+        index = np.flatnonzero(index)
+    elif index.size == 0:
+        index = index.astype(int)
+
+    positions, remapped = np.unique(index % size, return_inverse=True)
+
+    return positions, remapped.reshape(index.shape)
+
+
+class SparseAMatrix:
+    """
+    Sparse storage of an A matrix of shape (iterations, products, activities, years).
+    All iterations and years share one sparsity pattern, and the values of
+    each exchange are stored for each iteration and year.
+
+    The matrix is indexed like a dense NumPy array: items are returned as
+    dense arrays, and assigned items are added to the sparsity pattern if
+    they are non-zero. The only exception is a 2-D slice with one iteration
+    and one year (e.g., `A[0, ..., 0]`), which is returned as a CSR matrix,
+    to be passed to sparse solvers.
+
+    :ivar shape: shape of the matrix (iterations, products, activities, years)
+    :vartype shape: tuple
+    :ivar nnz: number of exchanges in the sparsity pattern
+    :vartype nnz: int
+    """
+
+    def __init__(self, matrix, iterations: int, years: int) -> None:
+        """
+        :param matrix: scipy.sparse matrix of shape (products, activities),
+            identical for all iterations and years
+        :param iterations: number of iterations
+        :param years: number of years
+        """
+
+        matrix = sparse.coo_matrix(matrix)
+        matrix.sum_duplicates()
+
+        self.shape = (iterations, *matrix.shape, years)
+        self.nnz = matrix.nnz
+
+        # position of each exchange in `values`, -1 if not in the pattern
+        self.position = np.full(matrix.shape, -1, dtype=np.int32)
+        self.position[matrix.row, matrix.col] = np.arange(self.nnz)
+
+        self.rows = matrix.row.copy()
+        self.cols = matrix.col.copy()
+        self.values = np.repeat(
+            np.repeat(matrix.data[None, :, None], iterations, axis=0), years, axis=-1
+        )
+
+    @property
+    def ndim(self) -> int:
+        return 4
+
+    def expand_key(self, key) -> tuple:
+        """
+        Return the index of each of the four axes of the matrix.
+
+        :param key: index, as given to :meth:`__getitem__`
+        :return: tuple of four indices
+        """
+
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        if any(k is Ellipsis for k in key):
+            i = next(i for i, k in enumerate(key) if k is Ellipsis)
+            key = key[:i] + (slice(None),) * (5 - len(key)) + key[i + 1 :]
+
+        return key + (slice(None),) * (4 - len(key))
+
+    def gather(self, iterations, rows, cols, years) -> np.ndarray:
+        """
+        Return the dense block of the matrix at the given positions.
+
+        :return: array of shape (iterations, rows, cols, years)
+        """
+
+        position = self.position[np.ix_(rows, cols)]
+        found = position >= 0
+
+        block = np.zeros((len(iterations), len(rows), len(cols), len(years)))
+        block[:, found, :] = self.values[np.ix_(iterations, position[found], years)]
+
+        return block
+
+    def add_exchanges(self, rows: np.ndarray, cols: np.ndarray) -> None:
+        """
+        Add exchanges to the sparsity pattern, with a value of zero.
+        Storage grows geometrically, to limit reallocations.
+
+        :param rows: row indices of the exchanges
+        :param cols: column indices of the exchanges
+        """
+
+        n = len(rows)
+        capacity = self.values.shape[1]
+
+        if self.nnz + n > capacity:
+            extra = max(capacity, self.nnz + n - capacity)
+            self.values = np.concatenate(
+                [
+                    self.values,
+                    np.zeros((self.shape[0], extra, self.shape[-1])),
+                ],
+                axis=1,
+            )
+            self.rows = np.concatenate([self.rows, np.zeros(extra, dtype=int)])
+            self.cols = np.concatenate([self.cols, np.zeros(extra, dtype=int)])
+
+        new = np.arange(self.nnz, self.nnz + n)
+        self.position[rows, cols] = new
+        self.rows[new], self.cols[new] = rows, cols
+        self.nnz += n
+
+    def tocsr(self, iteration: int, year: int) -> sparse.csr_matrix:
+        """
+        Return the matrix of one iteration and one year.
+
+        :param iteration: index of the iteration
+        :param year: index of the year
+        :return: CSR matrix of shape (products, activities)
+        """
+
+        matrix = sparse.csr_matrix(
+            (
+                self.values[iteration, : self.nnz, year],
+                (self.rows[: self.nnz], self.cols[: self.nnz]),
+            ),
+            shape=self.shape[1:3],
+        )
+        # exchanges set to zero are not passed to solvers
+        matrix.eliminate_zeros()
+
+        return matrix
+
+    def __getitem__(self, key):
+        key = self.expand_key(key)
+
+        if (
+            isinstance(key[0], (int, np.integer))
+            and isinstance(key[3], (int, np.integer))
+            and all(isinstance(k, slice) and k == slice(None) for k in key[1:3])
+        ):
+            return self.tocsr(key[0], key[3])
+
+        positions, remapped = zip(
+            *(compact_index(k, size) for k, size in zip(key, self.shape))
+        )
+
+        return self.gather(*positions)[remapped]
+
+    def __setitem__(self, key, value) -> None:
+        key = self.expand_key(key)
+        positions, remapped = zip(
+            *(compact_index(k, size) for k, size in zip(key, self.shape))
+        )
+        iterations, rows, cols, years = positions
+
+        block = self.gather(*positions)
+        block[remapped] = value
+
+        position = self.position[np.ix_(rows, cols)]
+        # NaN values are kept, as in a dense matrix
+        new = (position < 0) & (block != 0).any(axis=(0, 3))
+        if new.any():
+            new_rows, new_cols = np.nonzero(new)
+            self.add_exchanges(rows[new_rows], cols[new_cols])
+            position = self.position[np.ix_(rows, cols)]
+
+        found = position >= 0
+        self.values[np.ix_(iterations, position[found], years)] = block[:, found, :]
+
+    def __array__(self, dtype=None):
+        dense = np.zeros(self.shape, dtype=dtype)
+        dense[:, self.rows[: self.nnz], self.cols[: self.nnz], :] = self.values[
+            :, : self.nnz, :
+        ]
+        return dense
+
+    def __array_function__(self, func, types, args, kwargs):
+        if func is np.shape:
+            return self.shape
+
+        if func is np.ndim:
+            return self.ndim
+
+        if func is np.nan_to_num:
+            # replaces values in place, rather than copying the matrix
+            kwargs = {k: v for k, v in kwargs.items() if k != "copy"}
+            np.nan_to_num(self.values, copy=False, **kwargs)
+            return self
+
+        return NotImplemented
@@ -3,6 +3,9 @@ from pathlib import Path
 from typing import Union
 
 from carculator_utils.vehicle_input_parameters import VehicleInputParameters
+from klausen import NamedParameters
+
+from .parameter_store import load_parameter_store
 
 DEFAULT = Path(__file__, "..").resolve() / "data" / "default_parameters.json"
 EXTRA = Path(__file__, "..").resolve() / "data" / "extra_parameters.json"
@@ -11,14 +14,19 @@ EXTRA = Path(__file__, "..").resolve() / "data" / "extra_parameters.json"
 def load_parameters(obj):
     if isinstance(obj, (str, Path)):
         assert Path(obj).exists(), "Can't find this filepath"
-        return json.load(open(obj))
+        with open(obj, encoding="utf-8") as file:
+            return json.load(file)
     else:
         # Already in correct form, just return
         return obj
 
 
 class TruckInputParameters(VehicleInputParameters):
-    """ """
+    """
+    Input parameters of trucks. Default parameters are loaded from
+    an indexed archive compiled from `data/default_parameters.json`
+    (see :mod:`carculator_truck.parameter_store`).
+    """
 
     DEFAULT = Path(__file__, "..").resolve() / "data" / "default_parameters.json"
     EXTRA = Path(__file__, "..").resolve() / "data" / "extra_parameters.json"
@@ -29,4 +37,20 @@ class TruckInputParameters(VehicleInputParameters):
         extra: Union[str, Path, list] = None,
     ) -> None:
         """Create a `klausen <https://github.com/cmutel/klausen>`__ model with the car input parameters."""
-        super().__init__(None)
+
+        store = load_parameter_store(self.DEFAULT) if parameters is None else None
+
+        if store is None:
+            super().__init__(parameters, extra)
+            return
+
+        NamedParameters.__init__(self, None)
+        self.data, self.metadata, labels = store
+        extra = set(load_parameters(self.EXTRA if extra is None else extra))
+
+        self.sizes = labels["sizes"]
+        self.powertrains = labels["powertrains"]
+        # keep a list of input parameters, for sensitivity purpose
+        self.input_parameters = labels["names"]
+        self.parameters = sorted(set(self.input_parameters).union(extra))
+        self.years = labels["years"]
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from carculator_utils import get_standard_driving_cycle_and_gradient
+
+from carculator_truck.driving_cycles import (
+    get_driving_cycle,
+    get_driving_cycle_and_gradient,
+    get_road_gradient,
+    load_driving_cycle_and_gradient,
+)
+
+
+def test_driving_cycle_and_gradient():
+    # Cached data must equal the data loaded from file
+    cycle, gradient = get_standard_driving_cycle_and_gradient(
+        vehicle_type="truck", vehicle_sizes=["18t", "40t"], name="Long haul"
+    )
+
+    assert np.array_equal(get_driving_cycle(["18t", "40t"], "Long haul"), cycle)
+    assert np.array_equal(get_road_gradient(["18t", "40t"], "Long haul"), gradient)
+
+
+def test_driving_cycle_cache():
+    # The data is loaded once, and cannot be modified by callers
+    load_driving_cycle_and_gradient.cache_clear()
+
+    cycle, gradient = get_driving_cycle_and_gradient(["18t"], "Urban delivery")
+    assert get_driving_cycle("18t", "Urban delivery") is cycle
+    assert get_road_gradient(["18t"], "Urban delivery") is gradient
+    assert load_driving_cycle_and_gradient.cache_info().misses == 1
+
+    with pytest.raises(ValueError):
+        cycle[0] = 1
@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+import carculator_truck
+
+
+def test_lazy_imports():
+    # Importing the package must not import its dependencies
+    code = (
+        "import sys, carculator_truck; "
+        "print(','.join(m for m in ('numpy', 'xarray', 'yaml', 'carculator_utils') "
+        "if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert output.stdout.strip() == ""
+
+
+def test_public_names():
+    # All public names must be importable from the package
+    for name in carculator_truck.__all__:
+        assert getattr(carculator_truck, name) is not None
+        assert name in dir(carculator_truck)
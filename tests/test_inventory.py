@@ -19,6 +19,21 @@ def test_check_country():
     assert tm.country == ic.vm.country
 
 
+def test_input_index():
+    # Indices found by the input index must match a scan of the inputs
+    ic = InventoryTruck(tm)
+    assert ic.index.find(prefix="truck, ") == [
+        j for i, j in ic.inputs.items() if i[0].startswith("truck, ")
+    ]
+    assert ic.find_input_indices(
+        contains=("maintenance, lorry 16 metric ton",), excludes=("CH",), excludes_in=1
+    ) == [
+        j
+        for i, j in ic.inputs.items()
+        if "maintenance, lorry 16 metric ton" in i[0] and "CH" not in i[1]
+    ]
+
+
 def test_electricity_mix():
     # Electricity mix must be equal to 1
     ic = InventoryTruck(tm)
@@ -136,6 +151,31 @@ def test_fuel_blend():
         ic.calculate_impacts()
 
 
+def test_fuel_blends_dimension():
+    """Test that impacts along a fuel blend dimension are close to separate models"""
+    fb = {
+        "diesel": {
+            "primary": {"type": "diesel - biodiesel - palm oil", "share": [1] * 6},
+        },
+    }
+    tm.country = "CH"
+    results = InventoryTruck(tm, fuel_blends=[tm.fuel_blend, fb]).calculate_impacts()
+
+    assert results.sizes["fuel_blend"] == 2
+    assert np.allclose(
+        results.isel(fuel_blend=0), InventoryTruck(tm).calculate_impacts()
+    )
+
+    # the vehicles are not sized again for the fuel blend
+    tm_fb = TruckModel(array, cycle="Long haul", country="CH", fuel_blend=fb)
+    tm_fb.set_all()
+    assert np.allclose(
+        results.isel(fuel_blend=1).sum(dim="impact"),
+        InventoryTruck(tm_fb).calculate_impacts().sum(dim="impact"),
+        rtol=0.05,
+    )
+
+
 def test_countries():
     """Test that calculation works with all countries"""
     for c in ["AO", "AT", "AU"]:
@@ -148,6 +188,97 @@ def test_countries():
         ic.calculate_impacts()
 
 
+def test_countries_dimension():
+    """Test that impacts along a country dimension match separate inventories"""
+    tm.country = "CH"
+    results = InventoryTruck(tm, countries=["FR", "PL"]).calculate_impacts()
+
+    assert results.coords["country"].values.tolist() == ["FR", "PL"]
+    assert tm.country == "CH"
+
+    for c in ["FR", "PL"]:
+        tm.country = c
+        assert np.allclose(
+            results.sel(country=c), InventoryTruck(tm).calculate_impacts()
+        )
+    tm.country = "CH"
+
+
+def test_chunks():
+    """Test that processing iterations by chunks does not change the results"""
+    tip_stochastic = TruckInputParameters()
+    tip_stochastic.stochastic(3)
+    _, arr = fill_xarray_from_input_parameters(
+        tip_stochastic,
+        scope={"size": ["40t"], "powertrain": ["ICEV-d", "BEV"], "year": [2020]},
+    )
+
+    tm_full = TruckModel(arr.copy(), cycle="Long haul", country="CH")
+    tm_full.set_all()
+    tm_chunks = TruckModel(arr.copy(), cycle="Long haul", country="CH")
+    tm_chunks.set_all(chunk_size=2)
+
+    assert tm_chunks.array.sizes["value"] == 3
+    assert np.allclose(tm_full["TtW energy"], tm_chunks["TtW energy"])
+    assert np.allclose(tm_full["curb mass"], tm_chunks["curb mass"])
+
+    results = InventoryTruck(tm_full).calculate_impacts()
+    results_chunks = InventoryTruck(tm_full, chunk_size=2).calculate_impacts()
+    results_parallel = InventoryTruck(tm_full, n_workers=2).calculate_impacts()
+
+    assert results.shape == results_chunks.shape == results_parallel.shape
+    assert np.allclose(results, results_chunks)
+    assert np.allclose(results, results_parallel)
+
+
+def test_sparse_matrix():
+    """Test that the sparse A matrix gives the same inventory and results"""
+    ic = InventoryTruck(tm)
+    ic_sparse = InventoryTruck(tm, sparse_matrix=True)
+
+    assert ic_sparse.A.nnz < ic_sparse.A.shape[1] * ic_sparse.A.shape[2]
+    assert np.allclose(np.asarray(ic_sparse.A), ic.A)
+    assert np.allclose(ic.calculate_impacts(), ic_sparse.calculate_impacts())
+
+
+def test_background_factorisation():
+    """Test that the factorisation of the background is reused across inventories"""
+    from carculator_truck.inventory import BACKGROUND_FACTORISATIONS
+
+    BACKGROUND_FACTORISATIONS.clear()
+    InventoryTruck(tm, method="recipe", indicator="midpoint").calculate_impacts()
+    n_factorisations = len(BACKGROUND_FACTORISATIONS)
+
+    assert n_factorisations > 0
+
+    InventoryTruck(tm, method="recipe", indicator="endpoint").calculate_impacts()
+
+    assert len(BACKGROUND_FACTORISATIONS) == n_factorisations
+
+
+def test_technosphere_factorisation():
+    """Test that the factorised A matrix gives the same supply as solving it directly"""
+    import carculator_utils.inventory
+    from scipy import sparse
+    from scipy.sparse.linalg import spsolve
+
+    from carculator_truck.inventory import TechnosphereFactorisation
+
+    ic = InventoryTruck(tm)
+    matrix = sparse.csr_matrix(ic.A[0, ..., 0])
+    demand = np.zeros(matrix.shape[0])
+    demand[ic.index.find(prefix="transport, truck, ")[0]] = 1
+
+    factorisation = TechnosphereFactorisation(matrix, ic.background_size)
+    assert np.allclose(factorisation.solve(demand), spsolve(matrix, demand))
+
+    # the base method is called with stand-ins, restored afterwards
+    A = ic.A
+    ic.calculate_impacts()
+    assert ic.A is A
+    assert carculator_utils.inventory.sparse is sparse
+
+
 def test_endpoint():
     """Test if the correct impact categories are considered"""
     ic = InventoryTruck(tm, method="recipe", indicator="endpoint")
@@ -2,6 +2,7 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pytest
 from carculator_utils.array import fill_xarray_from_input_parameters
 
 from carculator_truck import TruckInputParameters, TruckModel
@@ -132,6 +133,452 @@ def test_battery_mass():
     )
 
 
+def test_sizing_solvers():
+    # Both solvers must converge to the same curb mass,
+    # and report the number of iterations for each vehicle
+    _, arr = fill_xarray_from_input_parameters(
+        tip, scope={"size": ["40t"], "powertrain": ["ICEV-d", "BEV"], "year": [2020]}
+    )
+
+    curb_masses = []
+    for solver in ["fixed-point", "secant"]:
+        model = TruckModel(arr.copy(), cycle="Long haul", country="CH")
+        model.set_all(solver=solver, tolerance=0.001)
+        assert (model.sizing_iterations >= 1).all()
+        curb_masses.append(model["curb mass"].values)
+
+    assert np.allclose(*curb_masses, rtol=0.01)
+
+    with pytest.raises(ValueError):
+        TruckModel(arr.copy(), cycle="Long haul").set_all(solver="newton")
+
+
+def test_sizing_freezes_converged_vehicles(monkeypatch):
+    # Vehicles that have converged are no longer recomputed, while the
+    # others are, and the results are those of sizing all vehicles
+    # until all of them have converged
+    _, arr = fill_xarray_from_input_parameters(
+        tip,
+        scope={
+            "size": ["3.5t", "26t"],
+            "powertrain": ["ICEV-d", "BEV"],
+            "year": [2020],
+        },
+    )
+    size_vehicles = TruckModel.size_vehicles
+
+    iterations = []
+
+    def record_iteration(self, active):
+        before = self.array.values.copy()
+        size_vehicles(self, active)
+        iterations.append((active.copy(), before, self.array.values.copy()))
+
+    with monkeypatch.context() as m:
+        m.setattr(TruckModel, "size_vehicles", record_iteration)
+        frozen = TruckModel(arr.copy(), cycle="Long haul")
+        frozen.set_all(tolerance=1e-6)
+
+    assert len(np.unique(frozen.sizing_iterations)) > 1
+    assert len(iterations) == frozen.sizing_iterations.max()
+
+    for i, (active, before, after) in enumerate(iterations):
+        assert (
+            active.sum(axis=(0, 1))
+            == (frozen.sizing_iterations > i).sum(dim=["size", "powertrain"])
+        ).all()
+        # the mask has dimensions (size, powertrain, year, value)
+        inactive = np.broadcast_to(~active[:, :, None], before.shape)
+        assert np.array_equal(before[inactive], after[inactive], equal_nan=True)
+
+    with monkeypatch.context() as m:
+        m.setattr(
+            TruckModel,
+            "size_vehicles",
+            lambda self, active: size_vehicles(self, np.ones_like(active)),
+        )
+        unfrozen = TruckModel(arr.copy(), cycle="Long haul")
+        unfrozen.set_all(tolerance=1e-6)
+
+    assert (unfrozen.sizing_iterations == frozen.sizing_iterations).all()
+    assert np.allclose(frozen.array, unfrozen.array, rtol=1e-5, equal_nan=True)
+
+
+def test_keep_energy():
+    # Streaming the energy model over the driving cycle must give
+    # the same results as keeping its second-by-second outputs
+    _, arr = fill_xarray_from_input_parameters(
+        tip,
+        scope={"size": ["18t"], "powertrain": ["ICEV-g", "BEV"], "year": [2020]},
+    )
+
+    reduced = TruckModel(arr.copy(), cycle="Urban delivery", energy_chunk_size=100)
+    reduced.set_all()
+    full = TruckModel(arr.copy(), cycle="Urban delivery", keep_energy=True)
+    full.set_all()
+
+    assert reduced.energy.sizes["second"] == 1
+    assert full.energy.sizes["second"] == reduced.energy_profile.sizes["second"]
+    # only the energy consumption of each vehicle is kept for each second
+    assert "parameter" not in reduced.energy_profile.dims
+    assert np.allclose(reduced.array, full.array, rtol=1e-5, equal_nan=True)
+
+
+def test_parallel_sizing():
+    # Chunks of iterations sized one after the other, or in parallel,
+    # must give the same results as all iterations sized at once
+    tip_stochastic = TruckInputParameters()
+    tip_stochastic.stochastic(4)
+    _, arr = fill_xarray_from_input_parameters(
+        tip_stochastic,
+        scope={"size": ["40t"], "powertrain": ["ICEV-d", "BEV"], "year": [2020]},
+    )
+
+    serial = TruckModel(arr.copy(), cycle="Long haul", seed=42)
+    serial.set_all()
+    chunked = TruckModel(arr.copy(), cycle="Long haul", seed=42)
+    chunked.set_all(chunk_size=3)
+    parallel = TruckModel(arr.copy(), cycle="Long haul", seed=42)
+    parallel.set_all(n_workers=2)
+
+    assert parallel.array.sizes["value"] == 4
+    # the energy consumption of each second is not kept for all iterations
+    assert chunked.energy_profile is None
+    assert serial.energy_profile is not None
+    assert np.allclose(serial.array, chunked.array, equal_nan=True)
+    assert np.allclose(serial.array, parallel.array, equal_nan=True)
+    assert not np.allclose(
+        serial["energy battery cost per kWh"].isel(value=0),
+        serial["energy battery cost per kWh"].isel(value=1),
+    )
+
+    # emissions cannot be calculated again without it
+    chunked["lifetime kilometers"] = chunked["lifetime kilometers"] * 1.1
+    with pytest.raises(ValueError):
+        chunked.recompute()
+
+
+def test_chunked_value_labels():
+    # Draws must not depend on the chunking of iterations,
+    # whatever the labels of the `value` dimension
+    from carculator_truck.sensitivity import get_sensitivity_array
+
+    _, arr = fill_xarray_from_input_parameters(
+        tip, scope={"size": ["40t"], "powertrain": ["BEV"], "year": [2020]}
+    )
+    sensitivity = get_sensitivity_array(arr, ["interest rate", "frontal area"])
+
+    serial = TruckModel(sensitivity.copy(), cycle="Long haul", seed=1)
+    serial.set_all()
+    chunked = TruckModel(sensitivity.copy(), cycle="Long haul", seed=1)
+    chunked.set_all(chunk_size=1)
+
+    # iterations of a sensitivity analysis are not drawn at random
+    costs = serial["energy battery cost per kWh"].values.ravel()
+    assert np.allclose(costs, costs[0])
+    assert np.allclose(serial.array, chunked.array, equal_nan=True)
+
+    tip_stochastic = TruckInputParameters()
+    tip_stochastic.stochastic(3)
+    _, arr = fill_xarray_from_input_parameters(
+        tip_stochastic,
+        scope={"size": ["40t"], "powertrain": ["BEV"], "year": [2020]},
+    )
+    arr = arr.assign_coords(value=["a", "b", "c"])
+
+    # each chunk draws the streams of its positions in the array
+    model = TruckModel(arr.copy(), cycle="Long haul", seed=1)
+    chunk = model.get_chunk(slice(1, 3))
+    model.adjust_cost()
+    chunk.adjust_cost()
+
+    costs = model["energy battery cost per kWh"]
+    assert len(np.unique(costs.values)) == 3
+    assert np.array_equal(
+        costs.isel(value=slice(1, 3)), chunk["energy battery cost per kWh"]
+    )
+
+
+def test_cycles(monkeypatch):
+    # Vehicles sized for several driving cycles at once must be
+    # the same as vehicles sized for each driving cycle
+    _, arr = fill_xarray_from_input_parameters(
+        tip, scope={"size": ["18t"], "powertrain": ["ICEV-d", "BEV"], "year": [2020]}
+    )
+    cycles = ["Urban delivery", "Long haul"]
+
+    # the costs of energy storage do not depend on the driving cycle,
+    # and are adjusted once for all driving cycles
+    calls = []
+    adjust_cost = TruckModel.adjust_cost
+    with monkeypatch.context() as m:
+        m.setattr(
+            TruckModel,
+            "adjust_cost",
+            lambda self: calls.append(self) or adjust_cost(self),
+        )
+        model = TruckModel(arr.copy(), cycle=cycles)
+        model.set_all()
+
+    assert calls == [model]
+    assert model.array.coords["cycle"].values.tolist() == cycles
+
+    for cycle in cycles:
+        single = TruckModel(arr.copy(), cycle=cycle)
+        single.set_all()
+        assert np.allclose(model.array.sel(cycle=cycle), single.array, equal_nan=True)
+        assert np.allclose(model.get_cycle(cycle).array, single.array, equal_nan=True)
+        assert np.allclose(
+            model.calculate_cost_impacts().sel(cycle=cycle),
+            single.calculate_cost_impacts(),
+            equal_nan=True,
+        )
+        assert np.allclose(
+            model.calculate_cost_sweep({"interest rate": [0.02, 0.08]}).sel(
+                cycle=cycle
+            ),
+            single.calculate_cost_sweep({"interest rate": [0.02, 0.08]}),
+            equal_nan=True,
+        )
+
+
+def test_energy_consumption_model_cache():
+    # Energy consumption models are shared by models with the same
+    # sizes, powertrains, driving cycle, gradient and country
+    from carculator_truck.model import ENERGY_CONSUMPTION_MODELS
+
+    _, arr = fill_xarray_from_input_parameters(
+        tip, scope={"size": ["18t"], "powertrain": ["ICEV-d", "BEV"], "year": [2020]}
+    )
+    ENERGY_CONSUMPTION_MODELS.clear()
+
+    first = TruckModel(arr.copy(), cycle="Urban delivery")
+    first.set_all()
+    n_models = len(ENERGY_CONSUMPTION_MODELS)
+    second = TruckModel(arr.copy(), cycle="Urban delivery")
+    second.set_all()
+
+    assert second.ecm is first.ecm
+    assert len(ENERGY_CONSUMPTION_MODELS) == n_models
+    assert np.allclose(first.array, second.array, equal_nan=True)
+
+    other = TruckModel(arr.copy(), cycle="Urban delivery", country="FR")
+    other.set_all()
+    assert other.ecm is not first.ecm
+
+
+def test_payload_and_annual_mileage():
+    # Payloads and annual mileages given as dictionaries or as pandas
+    # objects must be assigned to each (powertrain, size, year) combination
+    _, arr = fill_xarray_from_input_parameters(
+        tip,
+        scope={"size": ["18t", "40t"], "powertrain": ["ICEV-d", "BEV"], "year": [2020]},
+    )
+    payload = {
+        ("ICEV-d", "18t", 2020): 3000,
+        ("ICEV-d", "40t", 2020): 10000,
+        ("BEV", "18t", 2020): 2500,
+        ("BEV", "40t", 2020): 9000,
+    }
+    annual_mileage = pd.Series(
+        [60000, 90000, 50000, 80000],
+        index=pd.MultiIndex.from_tuples(
+            [
+                ("18t", "ICEV-d", 2020),
+                ("40t", "ICEV-d", 2020),
+                ("18t", "BEV", 2020),
+                ("40t", "BEV", 2020),
+            ],
+            names=["size", "powertrain", "year"],
+        ),
+    )
+
+    model = TruckModel(arr.copy(), payload=payload, annual_mileage=annual_mileage)
+    model.set_cargo_mass_and_annual_mileage()
+
+    for (p, s, y), v in payload.items():
+        assert np.all(
+            model.array.sel(powertrain=p, size=s, year=y, parameter="cargo mass") == v
+        )
+    for (s, p, y), v in annual_mileage.items():
+        assert np.all(
+            model.array.sel(
+                powertrain=p, size=s, year=y, parameter="kilometers per year"
+            )
+            == v
+        )
+
+    with pytest.raises(KeyError):
+        TruckModel(
+            arr.copy(), payload={("ICEV-d", "18t", 2020): 3000}
+        ).set_cargo_mass_and_annual_mileage()
+
+
+def test_cargo_masses_file(tmp_path):
+    # Generic payloads are loaded once per file, and can be read from another file
+    from carculator_truck.model import CARGO_MASSES, load_cargo_masses
+
+    tables = load_cargo_masses(CARGO_MASSES.resolve())
+    assert load_cargo_masses(CARGO_MASSES.resolve()) is tables
+    with pytest.raises(TypeError):
+        tables["payload"]["Long haul"]["40t"] = 0
+
+    filepath = tmp_path / "payloads.yaml"
+    filepath.write_text(
+        CARGO_MASSES.read_text(encoding="utf-8").replace("13800", "12000"),
+        encoding="utf-8",
+    )
+    _, arr = fill_xarray_from_input_parameters(
+        tip, scope={"size": ["40t"], "powertrain": ["ICEV-d"], "year": [2020]}
+    )
+    model = TruckModel(arr.copy(), cycle="Long haul", cargo_masses_file=filepath)
+    model.set_cargo_mass_and_annual_mileage()
+
+    assert np.all(model["cargo mass"] == 12000)
+
+
+def test_array_view():
+    # The view reads and writes the values of the array, by label
+    model = TruckModel(tm.array.copy(), cycle="Long haul", country="CH")
+    view = model.view
+
+    assert np.array_equal(view["curb mass"], model["curb mass"].values)
+    assert np.array_equal(
+        view["fuel mass", "ICEV-d", "40t"],
+        model.array.sel(parameter="fuel mass", powertrain="ICEV-d", size="40t"),
+    )
+    assert np.array_equal(
+        view[["curb mass", "cargo mass"]],
+        model.array.sel(parameter=["curb mass", "cargo mass"]),
+    )
+
+    view["curb mass"] = 1
+    view["fuel mass", "BEV"] *= 0
+    assert np.all(model["curb mass"] == 1)
+    assert np.all(model.array.sel(parameter="fuel mass", powertrain="BEV") == 0)
+
+    with pytest.raises(KeyError):
+        view["not a parameter"]
+
+    # the index follows the array when it is replaced
+    model.array = model.array.sel(size=["40t"])
+    assert model.view["curb mass"].shape[0] == 1
+
+
+def test_array_view_evaluate(monkeypatch):
+    # Expressions give the same results with NumPy and numexpr
+    import numexpr as ne
+
+    from carculator_truck import array_view
+
+    view = TruckModel(tm.array.copy(), cycle="Long haul", country="CH").view
+    view.evaluate(
+        "toll cost",
+        "toll / (cargo / 1000)",
+        toll="toll cost per km",
+        cargo="cargo mass",
+    )
+    assert np.array_equal(
+        view["toll cost"], view["toll cost per km"] / (view["cargo mass"] / 1000)
+    )
+
+    expected = TruckModel(tm.array.copy(), cycle="Long haul", country="CH")
+    expected.set_costs()
+
+    monkeypatch.setattr(array_view, "NUMEXPR_MIN_SIZE", 0)
+    monkeypatch.setattr(ne, "get_num_threads", lambda: 2)
+    model = TruckModel(tm.array.copy(), cycle="Long haul", country="CH")
+    model.set_costs()
+
+    assert np.allclose(model.array, expected.array, rtol=1e-5, equal_nan=True)
+
+
+def test_recompute():
+    # Parameters changed once the vehicles are sized are taken into account
+    # by the steps that depend on them, as if they were given beforehand
+    _, arr = fill_xarray_from_input_parameters(
+        tip,
+        scope={
+            "size": ["18t"],
+            "powertrain": ["ICEV-d", "BEV", "PHEV-d", "PHEV-e", "PHEV-c-d"],
+            "year": [2020],
+        },
+    )
+
+    model = TruckModel(arr.copy(), cycle="Regional delivery")
+    model.set_all()
+    assert model.recompute() == []
+
+    model["interest rate"] = 0.08
+    model["charger efficiency"] = 0.7
+    steps = model.recompute()
+    assert steps[:2] == ["set_electricity_consumption", "set_costs"]
+    assert "set_hot_emissions" not in steps
+    assert not model.changed
+
+    expected = TruckModel(arr.copy(), cycle="Regional delivery")
+    expected["interest rate"] = 0.08
+    expected["charger efficiency"] = 0.7
+    expected.set_all()
+    assert np.allclose(
+        model.array.sel(powertrain=expected.array.powertrain),
+        expected.array,
+        rtol=1e-5,
+        equal_nan=True,
+    )
+
+    model["curb mass"] = 10000
+    with pytest.raises(ValueError):
+        model.recompute()
+
+
+def test_calculate_cost_sweep():
+    # Costs swept over a grid of cost parameters must be the same
+    # as the costs of vehicles recomputed for each point of the grid
+    _, arr = fill_xarray_from_input_parameters(
+        tip,
+        scope={
+            "size": ["40t"],
+            "powertrain": ["ICEV-d", "BEV", "PHEV-d", "PHEV-e", "PHEV-c-d"],
+            "year": [2020],
+        },
+    )
+
+    model = TruckModel(arr.copy(), cycle="Long haul")
+    model.set_all()
+
+    sweep = model.calculate_cost_sweep(
+        {"interest rate": [0.02, 0.08], "energy cost per kWh": [0.1, 0.3, 0.5]}
+    )
+    assert sweep.dims[-2:] == ("interest rate", "energy cost per kWh")
+    assert sweep.shape[-2:] == (2, 3)
+
+    model["interest rate"] = 0.08
+    model["energy cost per kWh"] = 0.3
+    model.recompute()
+    expected = model.calculate_cost_impacts()
+
+    assert np.allclose(
+        sweep.isel({"interest rate": 1, "energy cost per kWh": 1}),
+        expected,
+        rtol=1e-5,
+        equal_nan=True,
+    )
+
+    # without interest, the purchase cost is spread evenly over the lifetime
+    sweep = model.calculate_cost_sweep({"interest rate": [0, 1e-4]})
+    assert np.isfinite(sweep.sel(powertrain="BEV")).all()
+    assert np.allclose(
+        sweep.isel({"interest rate": 0}),
+        sweep.isel({"interest rate": 1}),
+        rtol=1e-3,
+        equal_nan=True,
+    )
+
+    with pytest.raises(ValueError):
+        model.calculate_cost_sweep({"curb mass": [1000, 2000]})
+
+
 DATA = Path(__file__, "..").resolve() / "fixtures" / "trucks_values.xlsx"
 OUTPUT = Path(__file__, "..").resolve() / "fixtures" / "test_model_results.xlsx"
 ref = pd.read_excel(DATA, index_col=0)
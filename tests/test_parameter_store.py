@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+from carculator_truck import TruckInputParameters, parameter_store
+from carculator_truck.parameter_store import (
+    get_store_path,
+    is_fresh,
+    load_parameter_store,
+)
+from carculator_truck.truck_input_parameters import DEFAULT, load_parameters
+
+
+def test_parameter_store():
+    # Parameters loaded from the archive must equal those of the JSON file
+    assert is_fresh(DEFAULT)
+
+    tip = TruckInputParameters()
+    tip_json = TruckInputParameters(parameters=DEFAULT)
+
+    assert tip.data == tip_json.data
+    assert tip.parameters == tip_json.parameters
+    assert tip.years == tip_json.years
+    for key, metadata in tip_json.metadata.items():
+        assert dict(tip.metadata[key]) == metadata
+
+
+def test_parameter_store_freshness(tmp_path):
+    # The archive is built again when the JSON file changes
+    parameters = dict(list(load_parameters(DEFAULT).items())[:10])
+    source = tmp_path / "parameters.json"
+    source.write_text(json.dumps(parameters), encoding="utf-8")
+
+    data, _, _ = load_parameter_store(source)
+    assert is_fresh(source)
+    assert len(data) == 10
+
+    key = next(iter(parameters))
+    parameters[key]["amount"] += 1
+    source.write_text(json.dumps(parameters), encoding="utf-8")
+    assert not is_fresh(source)
+
+    data, metadata, _ = load_parameter_store(source)
+    assert data[key]["amount"] == parameters[key]["amount"]
+    assert metadata[key]["unit"] == parameters[key]["unit"]
+
+
+def test_parameter_store_stamp(tmp_path, monkeypatch):
+    # The JSON file is only hashed when its size or modification time change,
+    # and the archive is not built again if its contents did not change
+    parameters = dict(list(load_parameters(DEFAULT).items())[:10])
+    source = tmp_path / "parameters.json"
+    source.write_text(json.dumps(parameters), encoding="utf-8")
+    load_parameter_store(source)
+    target = get_store_path(source)
+    stamp = os.stat(target).st_mtime_ns
+
+    def hash_file(filepath):
+        raise AssertionError("The JSON file should not be hashed.")
+
+    with monkeypatch.context() as m:
+        m.setattr(parameter_store, "hash_file", hash_file)
+        assert is_fresh(source)
+
+    os.utime(source, ns=(stamp + 10**9, stamp + 10**9))
+    assert is_fresh(source)
+    load_parameter_store(source)
+    assert os.stat(target).st_mtime_ns == stamp
+
+    # no temporary file is left next to the archive
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "parameters.json",
+        "parameters.npz",
+    ]
+
+
+def test_parameter_store_unreadable(tmp_path, monkeypatch):
+    # An unreadable archive is built again, or the JSON file is read instead
+    parameters = dict(list(load_parameters(DEFAULT).items())[:10])
+    source = tmp_path / "parameters.json"
+    source.write_text(json.dumps(parameters), encoding="utf-8")
+    target = get_store_path(source)
+
+    target.write_bytes(b"PK\x03\x04 truncated")
+    assert not is_fresh(source)
+    data, _, _ = load_parameter_store(source)
+    assert is_fresh(source)
+    assert len(data) == 10
+
+    def build_parameter_store(source, target=None):
+        raise PermissionError
+
+    target.write_bytes(b"PK\x03\x04 truncated")
+    monkeypatch.setattr(parameter_store, "build_parameter_store", build_parameter_store)
+    with pytest.warns(UserWarning):
+        assert load_parameter_store(source) is None
@@ -0,0 +1,34 @@
+import json
+
+from carculator_utils.array import fill_xarray_from_input_parameters
+
+from carculator_truck import TruckInputParameters, TruckModel
+from carculator_truck.profiling import NO_STAGE, profile, stage
+
+
+def test_profile(tmp_path):
+    # Stages of set_all are recorded within a profile block, and written to a trace file
+    tip = TruckInputParameters()
+    tip.static()
+    _, arr = fill_xarray_from_input_parameters(
+        tip, scope={"size": ["40t"], "powertrain": ["ICEV-d"], "year": [2020]}
+    )
+
+    stages = []
+    trace_file = tmp_path / "trace.json"
+    with profile(
+        callback=lambda *args: stages.append(args), trace_file=trace_file
+    ) as profiler:
+        TruckModel(arr, cycle="Long haul").set_all()
+
+    names = [name for name, _, _ in stages]
+    assert {"set_all", "sizing iteration 1", "set_costs"}.issubset(names)
+    assert all(duration >= 0 for _, duration, _ in stages)
+    assert stages[-1][2]["powertrain"] == 1
+
+    trace = json.loads(trace_file.read_text(encoding="utf-8"))
+    assert len(trace["traceEvents"]) == len(profiler.events) == len(stages)
+    assert all(event["ph"] == "X" for event in trace["traceEvents"])
+
+    # outside of a profile block, stages are not recorded
+    assert stage("set_all") is NO_STAGE
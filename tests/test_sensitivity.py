@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from carculator_utils.array import fill_xarray_from_input_parameters
+
+from carculator_truck import TruckInputParameters, TruckModel
+from carculator_truck.sensitivity import calculate_elasticities, get_sensitivity_array
+
+tip = TruckInputParameters()
+tip.static()
+_, array = fill_xarray_from_input_parameters(
+    tip, scope={"size": ["40t"], "powertrain": ["ICEV-d", "BEV"], "year": [2020]}
+)
+
+
+def test_sensitivity_array():
+    # Each parameter is perturbed in its own iteration
+    sensitivity = get_sensitivity_array(array, ["interest rate", "frontal area"])
+
+    assert sensitivity.coords["value"].values.tolist() == [
+        "reference",
+        "interest rate",
+        "frontal area",
+    ]
+    assert np.allclose(
+        sensitivity.sel(parameter="interest rate", value="interest rate"),
+        array.sel(parameter="interest rate", value=0) * 1.1,
+    )
+    assert np.array_equal(
+        sensitivity.sel(parameter="interest rate", value="frontal area"),
+        array.sel(parameter="interest rate", value=0),
+    )
+
+    with pytest.raises(ValueError):
+        get_sensitivity_array(array, ["unknown parameter"])
+
+    tip_stochastic = TruckInputParameters()
+    tip_stochastic.stochastic(2)
+    _, stochastic = fill_xarray_from_input_parameters(
+        tip_stochastic,
+        scope={"size": ["40t"], "powertrain": ["ICEV-d"], "year": [2020]},
+    )
+    with pytest.raises(ValueError):
+        get_sensitivity_array(stochastic)
+
+
+def test_elasticities():
+    # Elasticities calculated in one run must be the same
+    # as those calculated from one run per perturbed parameter
+    parameters = ["interest rate", "frontal area"]
+    elasticities = calculate_elasticities(
+        array, parameters, model_kwargs={"cycle": "Long haul"}
+    )
+
+    assert elasticities.dims == ("parameter", "output", "size", "powertrain", "year")
+    assert elasticities.coords["parameter"].values.tolist() == parameters
+    assert "climate change" in elasticities.coords["output"].values
+
+    reference = TruckModel(array.copy(), cycle="Long haul")
+    reference.set_all()
+    for parameter in parameters:
+        perturbed = TruckModel(array.copy(), cycle="Long haul")
+        perturbed[parameter] = perturbed[parameter] * 1.1
+        perturbed.set_all()
+
+        expected = (
+            perturbed["total cost per km"] / reference["total cost per km"] - 1
+        ) / 0.1
+        assert np.allclose(
+            elasticities.sel(parameter=parameter, output="total cost per km"),
+            expected.isel(value=0),
+            rtol=1e-3,
+        )
+
+
+def test_chunked_elasticities():
+    # Elasticities must not depend on how iterations are chunked
+    parameters = ["interest rate", "frontal area", "energy battery cost per kWh"]
+    kwargs = {"model_kwargs": {"cycle": "Long haul", "seed": 1}, "impacts": False}
+
+    elasticities = calculate_elasticities(array, parameters, **kwargs)
+    chunked = calculate_elasticities(
+        array, parameters, set_all_kwargs={"chunk_size": 1}, **kwargs
+    )
+
+    assert np.allclose(elasticities, chunked, equal_nan=True)